@@ -0,0 +1,93 @@
+"""
+Heap del renderer y latencia por chat a lo largo de un recorrido largo (350 chats por defecto)
+contra benchmarks/fake_whatsapp.py, con y sin el modo de memoria acotada:
+
+    base     sin poda, sin límite de heap
+    acotado  --trim-dom + --heap-limit-mb (recarga / reinicio de Chrome por CDP)
+
+Cada corrida deja su CSV por chat (MEM_LOG_HEADERS) y la tabla compara el primer y el
+último 10% de chats: si el modo acotado funciona, heap y segundos por chat quedan planos.
+
+Uso:
+    python benchmarks/bench_browser_memory.py [--chats 350] [--per-chat 300] [--heap-limit 150]
+"""
+import argparse
+import csv
+import os
+import sys
+import tempfile
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.dirname(HERE))
+sys.path.insert(0, HERE)
+
+import fake_whatsapp  # noqa: E402
+import s_w  # noqa: E402
+from bench_e2e import make_driver  # noqa: E402
+
+
+def run(mode, url, n_chats, heap_limit, tmp):
+    s_w.TRIM_DOM = mode == "acotado"
+    s_w.MAX_NON_GROUP_CHAT = n_chats
+    s_w.WHATSAPP_URL = url
+
+    profile = os.path.join(tmp, f"chrome_{mode}")
+    md = s_w.ManagedDriver(
+        lambda: make_driver(profile),
+        heap_limit_mb=heap_limit if mode == "acotado" else 0,
+    )
+    mem_log = os.path.join(tmp, f"mem_{mode}.csv")
+    try:
+        md.start()
+        s_w.scrape_all_chats(
+            md, os.path.join(tmp, f"{mode}.csv"), os.path.join(tmp, f"{mode}.sqlite"), mem_log=mem_log,
+        )
+    finally:
+        md.quit()
+
+    with open(mem_log, newline="", encoding="utf-8") as f:
+        return list(csv.DictReader(f)), md
+
+
+def avg(rows, key):
+    return sum(float(r[key]) for r in rows) / len(rows) if rows else 0.0
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--chats", type=int, default=350)
+    parser.add_argument("--per-chat", type=int, default=300)
+    parser.add_argument("--latency", type=int, default=30, help="ms por carga perezosa en el fake")
+    parser.add_argument("--heap-limit", type=float, default=150, help="MB para el modo acotado")
+    args = parser.parse_args()
+
+    chats = fake_whatsapp.parse_chats(",".join(f"Contacto {k:03d}:{args.per_chat}" for k in range(args.chats)))
+    httpd, url = fake_whatsapp.serve(chats, latency_ms=args.latency)
+
+    results = {}
+    with tempfile.TemporaryDirectory() as tmp:
+        try:
+            with open(os.path.join(tmp, "scraper.log"), "w", encoding="utf-8") as log:
+                sys.stdout = log
+                try:
+                    for mode in ("base", "acotado"):
+                        results[mode] = run(mode, url, args.chats, args.heap_limit, tmp)
+                finally:
+                    sys.stdout = sys.__stdout__
+        finally:
+            httpd.shutdown()
+
+    print(f"{'modo':<9}{'chats':>6}{'heap 1º10%':>12}{'heap últ10%':>13}{'nodos últ10%':>14}"
+          f"{'s/chat 1º10%':>14}{'s/chat últ10%':>15}{'recargas':>10}{'reinicios':>11}")
+    for mode, (rows, md) in results.items():
+        k = max(1, len(rows) // 10)
+        first, last = rows[:k], rows[-k:]
+        print(
+            f"{mode:<9}{len(rows):>6}{avg(first, 'heap_mb'):>12.0f}{avg(last, 'heap_mb'):>13.0f}"
+            f"{avg(last, 'nodes'):>14.0f}{avg(first, 'seconds'):>14.2f}{avg(last, 'seconds'):>15.2f}"
+            f"{md.reloads:>10}{sum(md.restarts.values()):>11}"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,158 @@
+"""
+Benchmark end-to-end contra benchmarks/fake_whatsapp.py (no hace falta cuenta de WhatsApp).
+
+1) scrape_messages_from_current_chat sobre chats de 100, 10k y 100k mensajes
+2) recorrido completo del panel (scrape_all_chats) sobre muchos chats chicos
+
+Por cada caso: mensajes/segundo, comandos WebDriver por mensaje, pico de memoria
+Python (tracemalloc) y heap JS del navegador.
+
+Uso:
+    python benchmarks/bench_e2e.py [--sizes 100,10000,100000] [--latency 150] [--json resultados.json]
+"""
+import argparse
+import json
+import os
+import sys
+import tempfile
+import time
+import tracemalloc
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.dirname(HERE))
+sys.path.insert(0, HERE)
+
+from selenium import webdriver  # noqa: E402
+from selenium.webdriver.chrome.options import Options  # noqa: E402
+from selenium.webdriver.chrome.service import Service  # noqa: E402
+from webdriver_manager.chrome import ChromeDriverManager  # noqa: E402
+
+import fake_whatsapp  # noqa: E402
+import s_w  # noqa: E402
+
+
+def make_driver(user_data_dir, headed=False):
+    # Chrome limpio (sin el perfil real de WhatsApp)
+    options = Options()
+    if not headed:
+        options.add_argument("--headless=new")
+    options.add_argument("--window-size=1400,1000")
+    options.add_argument(f"--user-data-dir={user_data_dir}")
+    options.add_argument("--enable-precise-memory-info")
+    return webdriver.Chrome(service=Service(ChromeDriverManager().install()), options=options)
+
+
+def js_heap_mb(driver):
+    used = driver.execute_script("return performance.memory ? performance.memory.usedJSHeapSize : 0;") or 0
+    return used / (1024 * 1024)
+
+
+def measure(driver, fn, n_messages):
+    counts = s_w.count_webdriver_commands(driver)
+    cmds0 = counts["total"]
+    tracemalloc.start()
+    t0 = time.perf_counter()
+    result = fn()
+    seconds = time.perf_counter() - t0
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    cmds = counts["total"] - cmds0
+    return result, {
+        "seconds": round(seconds, 2),
+        "msgs_per_s": round(n_messages / seconds, 1) if seconds else 0.0,
+        "cmds": cmds,
+        "cmds_per_msg": round(cmds / n_messages, 3) if n_messages else 0.0,
+        "py_peak_mb": round(peak / (1024 * 1024), 1),
+        "js_heap_mb": round(js_heap_mb(driver), 1),
+    }
+
+
+def bench_single_chats(driver, sizes, page_kwargs):
+    chats = fake_whatsapp.parse_chats(",".join(f"Chat {n}:{n}" for n in sizes))
+    httpd, url = fake_whatsapp.serve(chats, **page_kwargs)
+    results = []
+    try:
+        for chat in chats:
+            driver.get(url)
+            s_w.get_first_chat_name(driver)  # espera a que cargue #pane-side
+
+            def run():
+                s_w.open_chat_by_title(driver, chat["title"])
+                return s_w.scrape_messages_from_current_chat(driver, chat["title"])
+
+            rows, stats = measure(driver, run, chat["n"])
+            stats.update({"case": f"chat {chat['n']}", "messages": chat["n"], "rows": len(rows)})
+            results.append(stats)
+            print_row(stats)
+    finally:
+        httpd.shutdown()
+    return results
+
+
+def bench_traversal(driver, n_chats, per_chat, page_kwargs, tmp):
+    chats = fake_whatsapp.parse_chats(",".join(f"Contacto {k:03d}:{per_chat}" for k in range(n_chats)))
+    httpd, url = fake_whatsapp.serve(chats, **page_kwargs)
+    s_w.MAX_NON_GROUP_CHAT = n_chats
+    try:
+        driver.get(url)
+        s_w.get_first_chat_name(driver)  # espera a que cargue #pane-side
+        out = os.path.join(tmp, "traversal.csv")
+        ckpt = os.path.join(tmp, "traversal.sqlite")
+        totals, stats = measure(driver, lambda: s_w.scrape_all_chats(driver, out, ckpt), n_chats * per_chat)
+        stats.update({"case": f"panel {n_chats}x{per_chat}", "messages": n_chats * per_chat, "rows": totals["messages"]})
+        print_row(stats)
+        return [stats]
+    finally:
+        httpd.shutdown()
+
+
+HEADER = f"{'caso':<18}{'msgs':>8}{'filas':>8}{'seg':>9}{'msgs/s':>9}{'cmds/msg':>10}{'py MB':>8}{'js MB':>8}"
+
+
+def print_row(st):
+    print(
+        f"{st['case']:<18}{st['messages']:>8}{st['rows']:>8}{st['seconds']:>9.1f}{st['msgs_per_s']:>9.1f}"
+        f"{st['cmds_per_msg']:>10.3f}{st['py_peak_mb']:>8.1f}{st['js_heap_mb']:>8.1f}",
+        file=sys.__stdout__,
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--sizes", default="100,10000,100000")
+    parser.add_argument("--latency", type=int, default=150, help="ms por carga perezosa en el fake")
+    parser.add_argument("--batch", type=int, default=40)
+    parser.add_argument("--traversal", default="30x200", help="chats x mensajes para el recorrido del panel ('' = omitir)")
+    parser.add_argument("--headed", action="store_true")
+    parser.add_argument("--json", default=None, help="guarda los resultados en este archivo")
+    args = parser.parse_args()
+
+    page_kwargs = {"latency_ms": args.latency, "batch": args.batch}
+    sizes = [int(x) for x in args.sizes.split(",") if x.strip()]
+
+    with tempfile.TemporaryDirectory() as tmp:
+        driver = make_driver(os.path.join(tmp, "chrome"), headed=args.headed)
+        try:
+            # los prints del scraper ensucian la tabla: van a un log
+            log_path = os.path.join(tmp, "scraper.log")
+            print(HEADER)
+            with open(log_path, "w", encoding="utf-8") as log:
+                sys.stdout = log
+                try:
+                    results = bench_single_chats(driver, sizes, page_kwargs)
+                    if args.traversal:
+                        n_chats, per_chat = (int(x) for x in args.traversal.split("x"))
+                        results += bench_traversal(driver, n_chats, per_chat, page_kwargs, tmp)
+                finally:
+                    sys.stdout = sys.__stdout__
+        finally:
+            driver.quit()
+
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(results, f, indent=2, ensure_ascii=False)
+        print(f"\nResultados en {args.json}")
+
+
+if __name__ == "__main__":
+    main()
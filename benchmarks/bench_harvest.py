@@ -0,0 +1,72 @@
+"""
+Compara el harvest original (find_elements + get_attribute/.text por elemento)
+contra el harvest JS de una sola llamada, sobre un chat real.
+
+Uso:
+    python benchmarks/bench_harvest.py "Nombre del chat"
+
+Reporta, por modo: comandos WebDriver, tiempo total y filas; y verifica que
+ambos modos devuelven las mismas filas (meta, text).
+"""
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import s_w  # noqa: E402
+
+
+def run_mode(driver, title, mode):
+    s_w.HARVEST_MODE = mode
+    s_w.open_chat_by_title(driver, title)
+
+    counts = s_w.count_webdriver_commands(driver)
+    start_cmds = counts["total"]
+    t0 = time.perf_counter()
+
+    # Un solo pase sobre lo visible (lo que se repite en cada iteración del scroll)
+    scroller = s_w.get_chat_scroller(driver)
+    s_w.harvest_rows(driver, scroller, mode)
+    pass_cmds = counts["total"] - start_cmds
+
+    rows = s_w.scrape_messages_from_current_chat(driver, title)
+
+    return {
+        "mode": mode,
+        "pass_cmds": pass_cmds,
+        "chat_cmds": counts["total"] - start_cmds - pass_cmds,
+        "seconds": time.perf_counter() - t0,
+        "rows": rows,
+    }
+
+
+def main():
+    if len(sys.argv) < 2:
+        print(__doc__)
+        sys.exit(1)
+    title = sys.argv[1]
+
+    driver = s_w.setup_driver()
+    try:
+        driver.get("https://web.whatsapp.com/")
+        s_w.wait_for_whatsapp_login(driver)
+
+        results = [run_mode(driver, title, "py"), run_mode(driver, title, "js")]
+
+        print(f"\n{'modo':<6}{'cmds/pase':>12}{'cmds/chat':>12}{'segundos':>12}{'filas':>8}")
+        for r in results:
+            print(f"{r['mode']:<6}{r['pass_cmds']:>12}{r['chat_cmds']:>12}{r['seconds']:>12.1f}{len(r['rows']):>8}")
+
+        py_rows = {(r["meta"], r["text"]) for r in results[0]["rows"]}
+        js_rows = {(r["meta"], r["text"]) for r in results[1]["rows"]}
+        if py_rows == js_rows:
+            print("\n✅ Mismas filas en ambos modos.")
+        else:
+            print(f"\n⚠️ Diferencias: solo py={len(py_rows - js_rows)} | solo js={len(js_rows - py_rows)}")
+    finally:
+        driver.quit()
+
+
+if __name__ == "__main__":
+    main()
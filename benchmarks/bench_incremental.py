@@ -0,0 +1,101 @@
+"""
+Harvest completo en cada paso (INCREMENTAL_HARVEST=False) vs incremental con marca de agua,
+sobre chats sintéticos cada vez más largos (benchmarks/fake_whatsapp.py).
+
+El recorrido completo re-lee todo lo cargado en cada paso (~cuadrático); el incremental
+solo visita lo recién cargado (~lineal). La tabla muestra dónde se cruzan.
+
+Uso:
+    python benchmarks/bench_incremental.py [--sizes 500,2000,8000,20000] [--latency 50]
+"""
+import argparse
+import os
+import sys
+import tempfile
+import time
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.dirname(HERE))
+sys.path.insert(0, HERE)
+
+import fake_whatsapp  # noqa: E402
+import s_w  # noqa: E402
+from bench_e2e import make_driver  # noqa: E402
+
+
+def timed_harvest(stats):
+    original = s_w.harvest_rows
+
+    def harvest_rows(*args, **kwargs):
+        t0 = time.perf_counter()
+        records = original(*args, **kwargs)
+        stats["harvest_s"] += time.perf_counter() - t0
+        stats["passes"] += 1
+        stats["records"] += len(records)
+        return records
+
+    return original, harvest_rows
+
+
+def run_case(driver, url, chat, incremental):
+    s_w.INCREMENTAL_HARVEST = incremental
+    stats = {"harvest_s": 0.0, "passes": 0, "records": 0}
+    original, wrapped = timed_harvest(stats)
+    s_w.harvest_rows = wrapped
+    try:
+        driver.get(url)
+        s_w.get_first_chat_name(driver)
+        s_w.open_chat_by_title(driver, chat["title"])
+        t0 = time.perf_counter()
+        rows = s_w.scrape_messages_from_current_chat(driver, chat["title"])
+        stats["total_s"] = time.perf_counter() - t0
+        stats["rows"] = len(rows)
+    finally:
+        s_w.harvest_rows = original
+    return stats
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--sizes", default="500,2000,8000,20000")
+    parser.add_argument("--latency", type=int, default=50)
+    parser.add_argument("--headed", action="store_true")
+    args = parser.parse_args()
+
+    sizes = [int(x) for x in args.sizes.split(",") if x.strip()]
+    chats = fake_whatsapp.parse_chats(",".join(f"Largo {n}:{n}" for n in sizes))
+    httpd, url = fake_whatsapp.serve(chats, latency_ms=args.latency, older_button_at=0)
+
+    print(f"{'mensajes':>9}{'modo':>13}{'pasos':>7}{'registros':>11}{'harvest s':>11}{'total s':>9}{'ms/paso':>9}")
+    crossover = None
+    with tempfile.TemporaryDirectory() as tmp:
+        driver = make_driver(os.path.join(tmp, "chrome"), headed=args.headed)
+        try:
+            for chat in chats:
+                res = {}
+                for incremental in (False, True):
+                    sys.stdout = open(os.devnull, "w", encoding="utf-8")
+                    try:
+                        st = run_case(driver, url, chat, incremental)
+                    finally:
+                        sys.stdout.close()
+                        sys.stdout = sys.__stdout__
+                    res[incremental] = st
+                    mode = "incremental" if incremental else "completo"
+                    per_pass = 1000 * st["harvest_s"] / st["passes"] if st["passes"] else 0.0
+                    print(f"{chat['n']:>9}{mode:>13}{st['passes']:>7}{st['records']:>11}"
+                          f"{st['harvest_s']:>11.2f}{st['total_s']:>9.1f}{per_pass:>9.1f}")
+                if crossover is None and res[True]["harvest_s"] < res[False]["harvest_s"]:
+                    crossover = chat["n"]
+        finally:
+            driver.quit()
+            httpd.shutdown()
+
+    if crossover:
+        print(f"\nEl incremental ya gana en harvest desde ~{crossover} mensajes.")
+    else:
+        print("\nSin cruce en los tamaños medidos.")
+
+
+if __name__ == "__main__":
+    main()
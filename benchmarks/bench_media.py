@@ -0,0 +1,63 @@
+"""
+Costo de --media: el mismo chat de benchmarks/fake_whatsapp.py scrapeado sin y con metadatos
+de adjuntos. Los metadatos salen del mismo execute_script del harvest, así que comandos
+WebDriver y segundos por chat deberían quedar iguales; la tabla muestra además cuántos
+audios / adjuntos trajeron duración, nombre, tamaño, tipo y dimensiones.
+
+Uso:
+    python benchmarks/bench_media.py [--messages 5000] [--latency 50]
+"""
+import argparse
+import os
+import sys
+import tempfile
+import time
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.dirname(HERE))
+sys.path.insert(0, HERE)
+
+import fake_whatsapp  # noqa: E402
+import s_w  # noqa: E402
+from bench_e2e import make_driver  # noqa: E402
+
+FIELDS = ("media_duration_s", "media_name", "media_size", "media_mime", "media_width")
+
+
+def run(driver, url, chat, media):
+    driver.get(url)
+    s_w.get_first_chat_name(driver)  # espera a que cargue #pane-side
+    s_w.open_chat_by_title(driver, chat["title"])
+    counts = s_w.count_webdriver_commands(driver)
+    cmds0 = counts["total"]
+    t0 = time.perf_counter()
+    rows = s_w.scrape_messages_from_current_chat(driver, chat["title"], media=media)
+    return rows, time.perf_counter() - t0, counts["total"] - cmds0
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--messages", type=int, default=5000)
+    parser.add_argument("--latency", type=int, default=50, help="ms por carga perezosa en el fake")
+    args = parser.parse_args()
+
+    chat = fake_whatsapp.parse_chats(f"Adjuntos:{args.messages}")[0]
+    httpd, url = fake_whatsapp.serve([chat], latency_ms=args.latency)
+
+    print(f"{'modo':<8}{'filas':>7}{'adjuntos':>10}{'seg':>8}{'cmds':>7}" + "".join(f"{f[6:]:>10}" for f in FIELDS))
+    with tempfile.TemporaryDirectory() as tmp:
+        driver = make_driver(os.path.join(tmp, "chrome"))
+        try:
+            for media in (False, True):
+                rows, seconds, cmds = run(driver, url, chat, media)
+                attached = [r for r in rows if r["kind"] != "TEXT"]
+                filled = "".join(f"{sum(1 for r in attached if r.get(f) is not None):>10}" for f in FIELDS)
+                print(f"{'media' if media else 'base':<8}{len(rows):>7}{len(attached):>10}{seconds:>8.1f}{cmds:>7}"
+                      + filled)
+        finally:
+            driver.quit()
+            httpd.shutdown()
+
+
+if __name__ == "__main__":
+    main()
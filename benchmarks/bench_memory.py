@@ -0,0 +1,82 @@
+"""
+Pico de memoria: all_rows + save_to_csv al final vs CsvStreamWriter chat por chat,
+sobre una corrida sintética (por defecto 500k filas repartidas en 350 chats).
+
+Uso:
+    python benchmarks/bench_memory.py [--rows 500000] [--chats 350]
+
+Cada modo corre en su propio proceso para que el pico de RSS no se mezcle.
+"""
+import argparse
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+def peak_rss_mb():
+    try:
+        import resource
+    except ImportError:  # Windows
+        return float("nan")
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux reporta KB, macOS bytes
+    return peak / (1024 * 1024) if sys.platform == "darwin" else peak / 1024
+
+
+def synthetic_chat(i, n):
+    contact = f"Contacto {i:03d}"
+    for j in range(n):
+        yield {
+            "contact": contact,
+            "meta": f"[{j % 24:02d}:{j % 60:02d}, {1 + j % 28}/{1 + j % 12}/2025] {contact}: ",
+            "text": f"mensaje {j} " + "x" * (20 + j % 120),
+        }
+
+
+def run(mode, total_rows, chats, out):
+    import s_w
+
+    per_chat = total_rows // chats
+    t0 = time.perf_counter()
+
+    if mode == "list":
+        all_rows = []
+        for i in range(chats):
+            all_rows.extend(list(synthetic_chat(i, per_chat)))
+        s_w.save_to_csv(out, all_rows)
+    else:
+        sink = s_w.CsvStreamWriter(out)
+        for i in range(chats):
+            sink.write_rows(list(synthetic_chat(i, per_chat)))
+            sink.flush()
+        sink.close()
+
+    print(f"{mode:<8}{per_chat * chats:>10}{time.perf_counter() - t0:>10.1f}{peak_rss_mb():>14.1f}")
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--rows", type=int, default=500_000)
+    parser.add_argument("--chats", type=int, default=350)
+    parser.add_argument("--mode", choices=["list", "stream"])
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        if args.mode:
+            run(args.mode, args.rows, args.chats, os.path.join(tmp, f"{args.mode}.csv"))
+            return
+
+        print(f"{'modo':<8}{'filas':>10}{'seg':>10}{'pico RSS MB':>14}")
+        for mode in ("list", "stream"):
+            subprocess.run(
+                [sys.executable, __file__, "--mode", mode, "--rows", str(args.rows), "--chats", str(args.chats)],
+                check=True,
+            )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,92 @@
+"""
+parse_date_from_meta fila por fila (la versión anterior: re.search + datetime por string, solo fecha)
+vs parse_metas en bloque (timestamp + fecha + remitente, con caché de cabeceras),
+sobre metas sintéticos con las variantes que usa WhatsApp (24h, "p. m.", "PM", yy / yyyy).
+
+Uso:
+    python benchmarks/bench_meta_parse.py [--n 1000000]
+
+Importar s_w necesita selenium instalado (no se abre ningún navegador).
+"""
+import argparse
+import os
+import random
+import re
+import sys
+import time
+from datetime import datetime
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import s_w  # noqa: E402
+
+
+def legacy_parse_date_from_meta(meta: str):
+    # copia de la versión anterior de s_w.parse_date_from_meta
+    if not meta:
+        return None
+    m = re.search(r"\b(\d{1,2})/(\d{1,2})/(\d{2,4})\b", meta)
+    if not m:
+        return None
+
+    d1, d2, y = m.group(1), m.group(2), m.group(3)
+    y = int("20" + y) if len(y) == 2 else int(y)
+
+    day = int(d1)
+    month = int(d2)
+
+    try:
+        return datetime(y, month, day).date()
+    except ValueError:
+        return None
+
+
+def synthetic_metas(n, seed=1):
+    """
+    Ráfagas como en un chat real: varios mensajes seguidos del mismo remitente en el mismo minuto.
+    """
+    rnd = random.Random(seed)
+    senders = [f"Contacto {i}" for i in range(40)] + ["+54 9 11 5555-0101", "Tú"]
+    formats = [
+        lambda h, mi, d, mo, y: f"[{h}:{mi:02d}, {d}/{mo}/{y}]",
+        lambda h, mi, d, mo, y: f"[{(h - 1) % 12 + 1}:{mi:02d} {'p. m.' if h >= 12 else 'a. m.'}, {d}/{mo}/{y % 100}]",
+        lambda h, mi, d, mo, y: f"[{(h - 1) % 12 + 1}:{mi:02d} {'PM' if h >= 12 else 'AM'}, {d}/{mo}/{y}]",
+    ]
+    metas = []
+    while len(metas) < n:
+        fmt = rnd.choice(formats)
+        head = fmt(rnd.randrange(24), rnd.randrange(60), rnd.randint(1, 28), rnd.randint(1, 12), rnd.randint(2019, 2025))
+        sender = rnd.choice(senders)
+        metas.extend([f"{head} {sender}: "] * rnd.randint(1, 8))
+    return metas[:n]
+
+
+def bench(label, fn, n):
+    t0 = time.perf_counter()
+    out = fn()
+    dt = time.perf_counter() - t0
+    print(f"{label:<34}{dt:>8.2f}s{n / dt / 1e6:>10.2f} M/s")
+    return out
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--n", type=int, default=1_000_000)
+    args = parser.parse_args()
+
+    metas = synthetic_metas(args.n)
+    print(f"{len(metas)} metas, {len({m.split(']')[0] for m in metas})} cabeceras distintas\n")
+    print(f"{'variante':<34}{'tiempo':>9}{'metas/s':>13}")
+
+    legacy = bench("legacy fila por fila (solo fecha)", lambda: [legacy_parse_date_from_meta(m) for m in metas], args.n)
+
+    s_w.META_CACHE.clear()
+    _, dates, _ = bench("parse_metas en bloque (frío)", lambda: s_w.parse_metas(metas), args.n)
+    bench("parse_metas en bloque (caché)", lambda: s_w.parse_metas(metas), args.n)
+
+    same = sum(a == b for a, b in zip(legacy, dates))
+    print(f"\nfechas iguales a la versión anterior: {same}/{len(metas)}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,246 @@
+"""
+WhatsApp Web de mentira para medir el scraper sin cuenta real.
+
+Sirve una página con la misma estructura que usa s_w.py:
+  - #pane-side con filas role="row" y span[@title] por chat (hora/Ayer/día, badge de no leídos)
+  - buscador en #side que filtra el panel por título, y #main header con el título del chat abierto
+  - div.copyable-area > [data-scrolltracepolicy='wa.web.conversation.messages'] con filas role="row",
+    nodos data-pre-plain-text, audios (data-icon audio-play / ptt-play), fotos (aria-label "Abrir foto")
+    y documentos (botón "Descargar" con nombre, páginas y tamaño)
+  - carga perezosa al llegar arriba, con latencia configurable
+  - botón "Haz clic aquí para obtener mensajes anteriores de tu teléfono" y banner E2E al final
+
+Uso:
+    python benchmarks/fake_whatsapp.py --chats "Ana:100,Beto:10000" --latency 300
+"""
+import argparse
+import http.server
+import json
+import threading
+
+PAGE = r"""<!doctype html>
+<html lang="es">
+<head>
+<meta charset="utf-8">
+<title>WhatsApp</title>
+<style>
+  body { margin: 0; font-family: sans-serif; display: flex; height: 100vh; }
+  #side { width: 30%; display: flex; flex-direction: column; }
+  #pane-side { flex: 1; overflow-y: auto; }
+  #side input { margin: 6px; padding: 6px; }
+  #pane-side div[role='row'] { height: 72px; border-bottom: 1px solid #eee; cursor: pointer; }
+  #main { flex: 1; display: flex; flex-direction: column; }
+  .copyable-area { flex: 1; display: flex; flex-direction: column; min-height: 0; }
+  [data-scrolltracepolicy] { flex: 1; overflow-y: auto; }
+  .msg { padding: 6px 12px; min-height: 36px; }
+  .msg img { width: 120px; height: 90px; background: #ccc; display: block; }
+</style>
+</head>
+<body>
+<div id="side"><input type="text" role="textbox" aria-label="Buscar un chat"><div id="pane-side" role="grid"></div></div>
+<div id="main"></div>
+<script>
+const CFG = __CONFIG__;
+const MINUTE = 60 * 1000;
+const DAYS = ["domingo", "lunes", "martes", "miércoles", "jueves", "viernes", "sábado"];
+const now = Date.now();
+const pad = (x) => String(x).padStart(2, "0");
+
+// Chat k: última actividad hace k * 9 horas; un mensaje cada 7 minutos hacia atrás.
+function msgTime(k, chat, i) { return new Date(now - k * 9 * 60 * MINUTE - (chat.n - 1 - i) * 7 * MINUTE); }
+function hhmm(d) { return d.getHours() + ":" + pad(d.getMinutes()); }
+function dmy(d) { return d.getDate() + "/" + (d.getMonth() + 1) + "/" + d.getFullYear(); }
+function paneLabel(d) {
+  const days = Math.floor((new Date(now).setHours(0, 0, 0, 0) - new Date(d).setHours(0, 0, 0, 0)) / (24 * 60 * MINUTE));
+  if (days <= 0) return hhmm(d);
+  if (days === 1) return "Ayer";
+  if (days < 7) return DAYS[d.getDay()];
+  return dmy(d);
+}
+function esc(s) { return String(s).replace(/&/g, "&amp;").replace(/"/g, "&quot;").replace(/</g, "&lt;"); }
+
+function msgHtml(k, chat, i) {
+  const d = msgTime(k, chat, i);
+  const mine = i % 3 === 0;
+  const sender = mine ? "Yo" : chat.title;
+  const id = (mine ? "true_" : "false_") + chat.phone + "@c.us_" + (0x3EB0000000 + i).toString(16).toUpperCase();
+  const time = '<span class="t">' + hhmm(d) + '</span>';
+  if (i % 37 === 5) {
+    const s = Math.floor(i / 37);
+    const icon = i % 2 ? "ptt-play" : "audio-play";
+    return '<div role="row"><div class="msg" data-id="' + id + '"><span data-icon="' + icon + '"></span>' +
+      '<span class="dur">' + Math.floor(s / 60) + ":" + pad(s % 60) + '</span>' + time + '</div></div>';
+  }
+  if (i % 53 === 7) {
+    return '<div role="row"><div class="msg" data-id="' + id + '"><div role="button" aria-label="Abrir foto">' +
+      '<img src="data:image/gif;base64,R0lGODlhAQABAAAAACw="></div>' + time + '</div></div>';
+  }
+  if (i % 61 === 11) {
+    const name = "informe_" + i + ".pdf";
+    return '<div role="row"><div class="msg" data-id="' + id + '"><div role="button" aria-label="Descargar" title="Descargar &quot;' +
+      name + '&quot;"><span data-icon="document-PDF-icon"></span><span title="' + name + '">' + name + '</span>' +
+      '<span>' + (1 + i % 9) + ' págs</span><span>PDF</span><span>' + (10 + i % 900) + ' kB</span></div>' + time + '</div></div>';
+  }
+  const meta = "[" + hhmm(d) + ", " + dmy(d) + "] " + sender + ": ";
+  return '<div role="row"><div class="msg" data-id="' + id + '"><div class="copyable-text" data-pre-plain-text="' +
+    esc(meta) + '"><span>Mensaje ' + i + " de " + esc(chat.title) + " " + "lorem ".repeat(i % 7) + '</span></div>' +
+    time + '</div></div>';
+}
+
+function renderPane() {
+  const pane = document.getElementById("pane-side");
+  pane.innerHTML = CFG.chats.map((chat, k) => {
+    const last = msgTime(k, chat, chat.n - 1);
+    const badge = chat.unread ? '<span aria-label="' + chat.unread + ' mensajes no leídos">' + chat.unread + '</span>' : "";
+    return '<div role="row" data-k="' + k + '"><div><span title="' + esc(chat.title) + '" dir="auto">' + esc(chat.title) +
+      '</span><div>' + paneLabel(last) + '</div></div><div><span title="Mensaje ' + (chat.n - 1) + '">Mensaje ' + (chat.n - 1) + '</span>' + badge + '</div></div>';
+  }).join("");
+  pane.addEventListener("click", (ev) => {
+    const row = ev.target.closest("div[role='row']");
+    if (row) openChat(Number(row.dataset.k));
+  });
+  document.querySelector("#side input").addEventListener("input", (ev) => {
+    const q = ev.target.value.trim().toLowerCase();
+    for (const row of pane.children) {
+      const title = CFG.chats[Number(row.dataset.k)].title.toLowerCase();
+      row.style.display = !q || title.includes(q) ? "" : "none";
+    }
+  });
+}
+
+let state = null;
+
+function openChat(k) {
+  const chat = CFG.chats[k];
+  const main = document.getElementById("main");
+  main.innerHTML = '<header><span title="' + esc(chat.title) + '" dir="auto">' + esc(chat.title) + '</span></header>' +
+    '<div class="copyable-area"><div data-scrolltracepolicy="wa.web.conversation.messages">' +
+    '<div class="top"></div><div class="rows"></div></div></div>';
+  const scroller = main.querySelector("[data-scrolltracepolicy]");
+  state = { k, chat, scroller, top: scroller.querySelector(".top"), rows: scroller.querySelector(".rows"),
+            loaded: 0, loading: false, buttonShown: false, buttonClicked: false };
+  setTimeout(() => {
+    if (!state || state.k !== k) return;
+    prepend(Math.min(CFG.initial, chat.n));
+    scroller.scrollTop = scroller.scrollHeight;
+    scroller.addEventListener("scroll", maybeLoad);
+  }, CFG.latency);
+}
+
+function prepend(count) {
+  const { k, chat, rows, scroller } = state;
+  const start = chat.n - state.loaded - count;
+  const parts = [];
+  for (let i = start; i < start + count; i++) parts.push(msgHtml(k, chat, i));
+  const before = scroller.scrollHeight;
+  rows.insertAdjacentHTML("afterbegin", parts.join(""));
+  scroller.scrollTop += scroller.scrollHeight - before;
+  state.loaded += count;
+  if (state.loaded >= chat.n) {
+    state.top.innerHTML = '<div class="e2e"><span>Los mensajes y las llamadas están cifrados de extremo a extremo. ' +
+      'Nadie fuera de este chat, ni siquiera WhatsApp, puede leerlos ni escucharlos.</span></div>';
+  }
+}
+
+function maybeLoad() {
+  const s = state;
+  if (!s || s.loading || s.loaded >= s.chat.n || s.scroller.scrollTop > 200) return;
+  if (CFG.olderButtonAt && s.loaded >= CFG.olderButtonAt && !s.buttonClicked) {
+    if (!s.buttonShown) {
+      s.buttonShown = true;
+      s.top.innerHTML = '<button><div>Haz clic aquí para obtener mensajes anteriores de tu teléfono.</div></button>';
+      s.top.querySelector("button").addEventListener("click", () => {
+        s.buttonClicked = true;
+        s.top.innerHTML = "";
+        maybeLoad();
+      });
+    }
+    return;
+  }
+  s.loading = true;
+  setTimeout(() => {
+    if (state !== s) return;
+    prepend(Math.min(CFG.batch, s.chat.n - s.loaded));
+    s.loading = false;
+  }, CFG.latency);
+}
+
+renderPane();
+</script>
+</body>
+</html>
+"""
+
+
+def parse_chats(spec):
+    """
+    "Ana:100,Beto:10000" -> [{"title": "Ana", "n": 100, ...}, ...]
+    """
+    chats = []
+    for k, part in enumerate(p for p in spec.split(",") if p.strip()):
+        title, _, n = part.rpartition(":")
+        chats.append({
+            "title": title.strip(),
+            "n": int(n),
+            "phone": f"51999{k:06d}",
+            "unread": (k * 7) % 5,
+        })
+    return chats
+
+
+def make_page(chats, latency_ms=300, batch=40, initial=30, older_button_at=500):
+    config = {
+        "chats": chats,
+        "latency": latency_ms,
+        "batch": batch,
+        "initial": initial,
+        "olderButtonAt": older_button_at,
+    }
+    return PAGE.replace("__CONFIG__", json.dumps(config, ensure_ascii=False)).encode("utf-8")
+
+
+def serve(chats, port=0, **page_kwargs):
+    """
+    Levanta el servidor en un hilo. Devuelve (httpd, url); cerrar con httpd.shutdown().
+    """
+    page = make_page(chats, **page_kwargs)
+
+    class Handler(http.server.BaseHTTPRequestHandler):
+        def do_GET(self):
+            self.send_response(200)
+            self.send_header("Content-Type", "text/html; charset=utf-8")
+            self.send_header("Content-Length", str(len(page)))
+            self.end_headers()
+            self.wfile.write(page)
+
+        def log_message(self, *args):
+            pass
+
+    httpd = http.server.ThreadingHTTPServer(("127.0.0.1", port), Handler)
+    threading.Thread(target=httpd.serve_forever, daemon=True).start()
+    return httpd, f"http://127.0.0.1:{httpd.server_address[1]}/"
+
+
+def main():
+    parser = argparse.ArgumentParser(description="WhatsApp Web de mentira para benchmarks")
+    parser.add_argument("--chats", default="Ana:100,Beto:10000,Carla:100000", help="titulo:mensajes,...")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--latency", type=int, default=300, help="ms por carga perezosa")
+    parser.add_argument("--batch", type=int, default=40, help="mensajes por carga")
+    parser.add_argument("--older-button-at", type=int, default=500,
+                        help="mensajes cargados antes de pedir 'Haz clic aquí...' (0 = nunca)")
+    args = parser.parse_args()
+
+    httpd, url = serve(
+        parse_chats(args.chats), port=args.port, latency_ms=args.latency, batch=args.batch,
+        older_button_at=args.older_button_at,
+    )
+    print(f"Sirviendo en {url} (Ctrl+C para salir)")
+    try:
+        threading.Event().wait()
+    except KeyboardInterrupt:
+        httpd.shutdown()
+
+
+if __name__ == "__main__":
+    main()
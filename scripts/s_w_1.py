@@ -1,7 +1,21 @@
+import argparse
+import base64
+import contextlib
 import csv
+import functools
+import json
+import multiprocessing
+import queue
 import time
 import os
+import hashlib
+import heapq
+import mimetypes
 import re
+import sqlite3
+import sys
+import threading
+import unicodedata
 from datetime import datetime, timedelta
 
 from selenium import webdriver
@@ -12,6 +26,14 @@ from selenium.webdriver.support.ui import WebDriverWait
 from selenium.webdriver.support import expected_conditions as EC
 from webdriver_manager.chrome import ChromeDriverManager
 from selenium.webdriver.common.keys import Keys
+from selenium.common.exceptions import SessionNotCreatedException, TimeoutException
+
+try:
+    import pyarrow as pa
+    import pyarrow.ipc as pa_ipc
+    import pyarrow.parquet as pq
+except ImportError:  # opcional: solo hace falta para --format parquet/arrow
+    pa = pa_ipc = pq = None
 
 #TIME_LIMIT_SECONDS = 5 * 60  # 5 minutos
 MAX_NON_GROUP_CHAT=350
@@ -20,8 +42,6 @@ CHAT_TIME_LIMIT_SECONDS = 40  #  por chat
 EXCLUDE_TITLES = {
     "Rosmery Papel Asesora de Viajes Terandes",
     "Canal Comercial y Ventas | TLA CTA",
-    "Salida fija Mex - Setiembre / 2025",
-    "Salida fija Mex-Julio/Agosto",
     "Marketing Digital CTA TLA",
     "Ross Mery Asesora De Ventas",
     "Christian TLA",
@@ -34,9 +54,6 @@ EXCLUDE_TITLES = {
     "VENTAS REDES SOCIALES INTERNO- LEADS Mercado Latino",
     "WhatsApp Business",
     "CULTURAS ANDINAS",
-    "Salida fija Mex - Setiembre / 2025 🇲🇽✈️🇵🇪",
-    "Salida fija Mex-Julio/Agosto",
-    "Salida fija Mex - Octubre 2025 🥳🙌🏻",
     "Notas 🐸",
     "Facebook",
     "Sistemas Rodrigo",
@@ -47,18 +64,170 @@ EXCLUDE_TITLES = {
     "Milu Operaciones Tla Cusco",
     "Christian"
 }
+# grupos que se renuevan (uno por mes / salida): se excluyen por prefijo, no uno por uno
+EXCLUDE_PREFIXES = {"Salida fija Mex"}
 META_BANNED_CHARS = {"*", "#", "•"} 
+WHATSAPP_URL = "https://web.whatsapp.com/"
 
 # ======================================================
 # 1) DRIVER (perfil persistente)
 # ======================================================
 
-def setup_driver(profile_name="wpp1"):
+# Headless Chrome se anuncia como "HeadlessChrome" (UA y client hints) y WhatsApp Web lo rechaza:
+# tras arrancar se le pone el UA de ese mismo Chrome sin "Headless" (set_headless_user_agent)
+CLIENT_HINTS_PLATFORM = {"win32": "Windows", "darwin": "macOS"}.get(sys.platform, "Linux")
+
+
+# Menos carga por navegador: sin imágenes, sin autoplay y sin descargas automáticas.
+# El QR es un <canvas> y los mensajes se leen por texto/aria-label, así que no se pierde nada.
+BLOCK_MEDIA_PREFS = {
+    "profile.managed_default_content_settings.images": 2,
+    "profile.default_content_setting_values.automatic_downloads": 2,
+    "download_restrictions": 3,
+}
+
+
+def chrome_base_options(headless=False, block_media=True):
     chrome_options = Options()
-    chrome_options.add_argument("--start-maximized")
+    if headless:
+        chrome_options.add_argument("--headless=new")
+        chrome_options.add_argument("--window-size=1920,1080")
+    else:
+        chrome_options.add_argument("--start-maximized")
     chrome_options.add_argument("--disable-extensions")
     chrome_options.add_argument("--disable-notifications")
     chrome_options.add_experimental_option("excludeSwitches", ["enable-logging"])
+    if block_media:
+        chrome_options.add_argument("--autoplay-policy=user-gesture-required")
+        chrome_options.add_experimental_option("prefs", BLOCK_MEDIA_PREFS)
+    return chrome_options
+
+
+# chromedriver resuelto una vez por versión de Chrome: {"124": "/ruta/chromedriver", ...}
+DRIVER_CACHE_FILE = "chromedriver_cache.json"
+
+# tiempos del último arranque (resolver driver / lanzar Chrome)
+STARTUP_STATS = {}
+
+
+def chrome_major_version(profile_dir):
+    # Chrome deja su versión en "<user-data-dir>/Last Version" en cada arranque: sin red ni subprocess
+    try:
+        with open(os.path.join(profile_dir, "Last Version"), encoding="utf-8") as f:
+            return f.read().strip().split(".")[0] or None
+    except OSError:
+        return None
+
+
+def load_driver_cache(cache_dir):
+    try:
+        with open(os.path.join(cache_dir, DRIVER_CACHE_FILE), encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
+def remember_chromedriver(cache_dir, browser_version, path):
+    major = (browser_version or "").split(".")[0]
+    if not major or not path:
+        return
+    cache = load_driver_cache(cache_dir)
+    if cache.get(major) == path:
+        return
+    cache[major] = path
+    # varios workers pueden arrancar a la vez: escribir aparte y reemplazar de una
+    tmp = os.path.join(cache_dir, f"{DRIVER_CACHE_FILE}.{os.getpid()}.tmp")
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump(cache, f, indent=2)
+    os.replace(tmp, os.path.join(cache_dir, DRIVER_CACHE_FILE))
+
+
+def forget_chromedriver(cache_dir, path):
+    """Saca de la caché las entradas que apuntan a path (driver que ya no sirve para este Chrome)."""
+    cache = load_driver_cache(cache_dir)
+    kept = {major: p for major, p in cache.items() if p != path}
+    if kept == cache:
+        return
+    tmp = os.path.join(cache_dir, f"{DRIVER_CACHE_FILE}.{os.getpid()}.tmp")
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump(kept, f, indent=2)
+    os.replace(tmp, os.path.join(cache_dir, DRIVER_CACHE_FILE))
+
+
+def resolve_chromedriver(cache_dir, profile_dir, use_cache=True):
+    """
+    Ruta a chromedriver sin tocar la red si se puede:
+    1) $CHROMEDRIVER (runners offline), 2) caché por versión de Chrome en cache_dir,
+    3) ChromeDriverManager().install() (red), 4) None -> Selenium Manager / PATH.
+    Con use_cache=False se saltea el paso 2. Devuelve (ruta o None, origen).
+    """
+    env_path = os.environ.get("CHROMEDRIVER")
+    if env_path and os.path.exists(env_path):
+        return env_path, "env"
+
+    major = chrome_major_version(profile_dir)
+    cached = load_driver_cache(cache_dir).get(major) if major and use_cache else None
+    if cached and os.path.exists(cached):
+        return cached, "caché"
+
+    try:
+        return ChromeDriverManager().install(), "descarga"
+    except Exception as e:
+        print(f"⚠️ ChromeDriverManager falló ({e}); se usa Selenium Manager / PATH.")
+        return None, "selenium-manager"
+
+
+def set_headless_user_agent(driver):
+    """UA y marcas del Chrome que arrancó (no uno fijo que queda viejo con cada actualización)."""
+    try:
+        ua = driver.execute_cdp_cmd("Browser.getVersion", {})["userAgent"].replace("HeadlessChrome", "Chrome")
+        version = driver.capabilities.get("browserVersion", "")
+        major = version.split(".")[0]
+        names = ("Chromium", "Google Chrome")
+        driver.execute_cdp_cmd("Network.setUserAgentOverride", {
+            "userAgent": ua,
+            "userAgentMetadata": {
+                "brands": [{"brand": n, "version": major} for n in names] + [{"brand": "Not-A.Brand", "version": "99"}],
+                "fullVersionList": [{"brand": n, "version": version} for n in names]
+                                   + [{"brand": "Not-A.Brand", "version": "99.0.0.0"}],
+                "platform": CLIENT_HINTS_PLATFORM, "platformVersion": "", "architecture": "", "model": "",
+                "mobile": False,
+            },
+        })
+    except Exception as e:
+        print("⚠️ No se pudo ajustar el user agent headless:", e)
+
+
+def start_chrome(chrome_options, cache_dir, profile_dir):
+    t0 = time.perf_counter()
+    path, source = resolve_chromedriver(cache_dir, profile_dir)
+    t1 = time.perf_counter()
+    service = Service(path) if path else Service()
+    try:
+        driver = webdriver.Chrome(service=service, options=chrome_options)
+    except SessionNotCreatedException as e:
+        # 'Last Version' lo escribe Chrome al arrancar: si se actualizó desde la última corrida,
+        # el driver de la caché es de la versión anterior. Se descarta y se resuelve de nuevo.
+        if source != "caché":
+            raise
+        print(f"⚠️ El chromedriver de la caché no sirve para este Chrome ({e.msg}); se resuelve de nuevo.")
+        forget_chromedriver(cache_dir, path)
+        path, source = resolve_chromedriver(cache_dir, profile_dir, use_cache=False)
+        t1 = time.perf_counter()
+        service = Service(path) if path else Service()
+        driver = webdriver.Chrome(service=service, options=chrome_options)
+    t2 = time.perf_counter()
+    if "--headless=new" in chrome_options.arguments:
+        set_headless_user_agent(driver)
+
+    remember_chromedriver(cache_dir, driver.capabilities.get("browserVersion"), driver.service.path)
+    STARTUP_STATS.update({"resolve": t1 - t0, "launch": t2 - t1, "source": source})
+    print(f"🚀 Chrome listo en {t2 - t0:.1f}s (chromedriver: {t1 - t0:.2f}s, {source})")
+    return driver
+
+
+def setup_driver(profile_name="wpp1", headless=False, block_media=True):
+    chrome_options = chrome_base_options(headless=headless, block_media=block_media)
 
     # ✅ Carpeta base con múltiples perfiles
     base_dir = os.path.join(os.path.expanduser("~"), "whatsapp_selenium_profiles")
@@ -70,26 +239,578 @@ def setup_driver(profile_name="wpp1"):
 
     chrome_options.add_argument(f"--user-data-dir={profile_dir}")
 
-    service = Service(ChromeDriverManager().install())
-    return webdriver.Chrome(service=service, options=chrome_options)
+    # la caché de chromedriver la comparten todos los perfiles
+    return start_chrome(chrome_options, base_dir, profile_dir)
 
 
 
 
-def wait_for_whatsapp_login(driver):
-    print("\n" + "=" * 60)
-    print("INICIA SESIÓN EN WHATSAPP WEB")
-    print("1) Escanea el QR si es necesario")
-    print("2) Espera a que cargue la lista de chats")
-    print("3) Vuelve aquí y presiona ENTER")
-    print("=" * 60 + "\n")
-    input("Presiona ENTER cuando WhatsApp Web esté listo...")
+# 'ready' con la lista de chats, 'qr' si WhatsApp pide escanear, 'loading' mientras tanto
+LOGIN_PROBE_JS = r"""
+if (document.querySelector('#pane-side')) return 'ready';
+if (document.querySelector('canvas[aria-label], div[data-ref] canvas')) return 'qr';
+return 'loading';
+"""
 
-    WebDriverWait(driver, 30).until(
-        EC.presence_of_element_located((By.ID, "pane-side"))
+
+def wait_for_whatsapp_login(driver, interactive=True, timeout=30):
+    """
+    interactive=False (headless / programado): no pregunta nada, sondea hasta que cargue
+    #pane-side con la sesión guardada en el perfil. Si WhatsApp muestra el QR más de unos
+    segundos la sesión no existe: falla enseguida en vez de esperar todo el timeout.
+    """
+    if interactive:
+        print("\n" + "=" * 60)
+        print("INICIA SESIÓN EN WHATSAPP WEB")
+        print("1) Escanea el QR si es necesario")
+        print("2) Espera a que cargue la lista de chats")
+        print("3) Vuelve aquí y presiona ENTER")
+        print("=" * 60 + "\n")
+        input("Presiona ENTER cuando WhatsApp Web esté listo...")
+
+        WebDriverWait(driver, timeout).until(
+            EC.presence_of_element_located((By.ID, "pane-side"))
+        )
+        return
+
+    t0 = time.time()
+    qr_since = None
+    while True:
+        state = driver.execute_script(LOGIN_PROBE_JS)
+        if state == "ready":
+            print(f"✅ WhatsApp Web listo en {time.time() - t0:.1f}s")
+            return
+        if state == "qr":
+            qr_since = qr_since or time.time()
+            if time.time() - qr_since > 10:
+                raise RuntimeError("WhatsApp pide escanear el QR: abrí el perfil una vez con ventana (sin --headless)")
+        else:
+            qr_since = None
+        if time.time() - t0 > timeout:
+            raise TimeoutException(f"#pane-side no cargó en {timeout}s")
+        time.sleep(0.5)
+
+
+# ======================================================
+# 1b) ESPERAS ADAPTATIVAS (en vez de time.sleep fijos)
+# ======================================================
+
+# True: cada espera vuelve apenas cambia el DOM (con el sleep fijo de antes como tope).
+# False: sleeps fijos originales (sirve de línea base para comparar).
+ADAPTIVE_WAITS = True
+
+# Acumulado de la corrida: "fixed" = lo que habrían dormido los sleeps fijos, "waited" = lo real
+WAIT_STATS = {"fixed": 0.0, "waited": 0.0}
+
+WAIT_FOR_CHANGE_JS = r"""
+const el = arguments[0], timeoutMs = arguments[1], settleMs = arguments[2];
+const done = arguments[arguments.length - 1];
+const rows = () => el.querySelectorAll("div[role='row']").length;
+const h0 = el.scrollHeight, n0 = rows();
+let finished = false, settle = null;
+
+function finish(changed) {
+  if (finished) return;
+  finished = true;
+  obs.disconnect();
+  clearTimeout(hard);
+  clearTimeout(settle);
+  done(changed);
+}
+
+// Cada mutación reinicia una ventana corta de calma; cuando el DOM se queda quieto, volvemos.
+const obs = new MutationObserver(() => {
+  clearTimeout(settle);
+  settle = setTimeout(() => finish(true), settleMs);
+});
+obs.observe(el, {childList: true, subtree: true});
+const hard = setTimeout(() => finish(el.scrollHeight !== h0 || rows() !== n0), timeoutMs);
+"""
+
+
+def record_wait(fixed, t0):
+    WAIT_STATS["fixed"] += fixed
+    WAIT_STATS["waited"] += time.time() - t0
+
+
+def wait_for_dom_change(driver, el, timeout, settle=0.15):
+    """
+    Una sola llamada async: MutationObserver sobre `el`; devuelve True si cambió
+    (filas nuevas / scrollHeight) antes de `timeout` segundos.
+    """
+    try:
+        return bool(driver.execute_async_script(WAIT_FOR_CHANGE_JS, el, int(timeout * 1000), int(settle * 1000)))
+    except Exception:
+        return False
+
+
+def pause(driver, el, fixed, timeout=None):
+    """
+    Reemplazo de time.sleep(fixed).
+    Con ADAPTIVE_WAITS espera como mucho `timeout` (por defecto `fixed`) a que cambie el DOM de `el`;
+    con el=None no hay nada que observar y no se espera.
+    """
+    t0 = time.time()
+    if not ADAPTIVE_WAITS:
+        time.sleep(fixed)
+    elif el is not None:
+        wait_for_dom_change(driver, el, fixed if timeout is None else timeout)
+    record_wait(fixed, t0)
+
+
+def wait_stats_since(snapshot):
+    """(fijo, real) en segundos desde un snapshot dict(WAIT_STATS)."""
+    return WAIT_STATS["fixed"] - snapshot["fixed"], WAIT_STATS["waited"] - snapshot["waited"]
+
+
+# ======================================================
+# 1c) DRIVER DE LARGA VIDA (health-check + reinicio)
+# ======================================================
+
+# intentos por chat si Chrome se cae mientras se scrapea (después se da por perdido)
+MAX_CHAT_ATTEMPTS = 2
+
+
+class ManagedDriver:
+    """
+    Chrome de larga vida sobre setup_driver: detecta sesiones muertas (crash, pestaña colgada,
+    WhatsApp recargado) y reinicia el navegador sobre el mismo perfil, sin QR.
+    Un perfil de WhatsApp admite una sola pestaña activa, así que el "pool" es de un driver por
+    perfil; la paralelización entre perfiles la hace run_profiles_parallel en s_w_1.py.
+    - factory: callable que devuelve un webdriver nuevo (None = driver externo, no se reinicia).
+    - recycle_every: reinicio preventivo cada N chats para cortar la hinchazón de memoria (0 = nunca).
+    - heap_limit_mb: si el heap JS (CDP) pasa este límite tras un chat, se recarga WhatsApp
+      y, si la recarga no alcanza, se reinicia Chrome (0 = no mirar el heap).
+    - max_restarts: caídas toleradas antes de abortar la corrida (los reinicios planificados no cuentan).
+    """
+
+    def __init__(self, factory=None, driver=None, recycle_every=0, login_timeout=120, max_restarts=10,
+                 heap_limit_mb=0):
+        self.factory = factory
+        self.driver = driver
+        self.recycle_every = recycle_every
+        self.login_timeout = login_timeout
+        self.max_restarts = max_restarts
+        self.heap_limit_mb = heap_limit_mb
+        self.restarts = {"crash": 0, "recycle": 0, "memory": 0}
+        self.reloads = 0
+        self.chats_since_start = 0
+
+    def start(self, interactive=False):
+        self.driver = self.factory()
+        self.driver.get(WHATSAPP_URL)
+        wait_for_whatsapp_login(self.driver, interactive=interactive, timeout=self.login_timeout)
+        self.chats_since_start = 0
+        return self.driver
+
+    def healthy(self):
+        try:
+            return self.driver.execute_script(LOGIN_PROBE_JS) == "ready"
+        except Exception:
+            return False
+
+    def restart(self, reason="crash"):
+        if self.factory is None:
+            raise RuntimeError("driver externo: no se puede reiniciar")
+        # solo las caídas cuentan para el límite: reciclados y reinicios por memoria son planificados
+        if reason == "crash" and self.restarts["crash"] >= self.max_restarts:
+            raise RuntimeError(f"Chrome se cayó {self.max_restarts} veces: se aborta la corrida")
+        self.restarts[reason] += 1
+        self.quit()
+        t0 = time.time()
+        self.start()
+        print(f"🔄 Chrome reiniciado ({reason}) en {time.time() - t0:.1f}s | reinicios: {self.restarts}")
+        return self.driver
+
+    def reload(self):
+        # recarga la página: el renderer suelta el heap de WhatsApp sin relanzar Chrome
+        self.reloads += 1
+        self.driver.get(WHATSAPP_URL)
+        wait_for_whatsapp_login(self.driver, interactive=False, timeout=self.login_timeout)
+
+    def chat_done(self, heap_mb=None):
+        """
+        Llamar después de cada chat; devuelve True si se recargó o recicló el navegador
+        (el panel vuelve arriba). heap_mb: heap actual, de browser_metrics.
+        """
+        self.chats_since_start += 1
+        if self.recycle_every and self.factory and self.chats_since_start >= self.recycle_every:
+            self.restart("recycle")
+            return True
+        if self.heap_limit_mb and heap_mb and heap_mb > self.heap_limit_mb:
+            self.reload()
+            after = browser_metrics(self.driver).get("heap_mb", 0.0)
+            print(f"🧠 Heap {heap_mb:.0f} MB > {self.heap_limit_mb} MB: recarga -> {after:.0f} MB")
+            if after > self.heap_limit_mb * 0.8 and self.factory:
+                self.restart("memory")
+            return True
+        return False
+
+    def quit(self):
+        if self.driver is not None:
+            try:
+                self.driver.quit()
+            except Exception:
+                pass
+            self.driver = None
+
+
+# ======================================================
+# 1d) MEMORIA DEL NAVEGADOR (poda del DOM + heap por CDP)
+# ======================================================
+
+# True (--trim-dom): las filas ya cosechadas que quedaron lejos, debajo de la vista, dejan de
+# renderizarse (se conserva la fila con su alto para no mover el scroll). Necesita INCREMENTAL_HARVEST.
+TRIM_DOM = False
+TRIM_KEEP_PX = 3000       # margen intacto debajo de la vista
+TRIM_EVERY_PASSES = 5     # una poda cada N pasos de scroll
+
+# Las filas se ocultan con content-visibility (sin estilo, layout ni pintado de su contenido) pero
+# no se tocan sus hijos: son los mensajes más nuevos, los que React sigue actualizando (tildes de
+# leído, reacciones, ediciones), y un hijo que falta rompería su render. Lecturas primero y
+# escrituras después (sin layout thrashing).
+TRIM_ROWS_JS = r"""
+const scroller = arguments[0], session = arguments[1], keepPx = arguments[2];
+const limit = scroller.getBoundingClientRect().bottom + keepPx;
+
+// se sigue desde la última fila podada (en este chat) hacia arriba
+let edge = window.__waTrimEdge;
+let row = edge && edge.isConnected && scroller.contains(edge) ? edge.previousElementSibling : null;
+if (!row) {
+  const all = scroller.querySelectorAll("div[role='row']");
+  row = all.length ? all[all.length - 1] : null;
+}
+
+const todo = [];
+for (; row; row = row.previousElementSibling) {
+  if (row.getAttribute("role") !== "row") continue;
+  if (row.hasAttribute("data-wa-trimmed")) { edge = row; continue; }
+  const rect = row.getBoundingClientRect();
+  if (rect.top < limit || row.getAttribute("data-wa-seen") !== session) break;
+  todo.push([row, rect.height]);
+}
+
+for (const [r, h] of todo) {
+  r.style.height = h + "px";
+  r.style.contentVisibility = "hidden";
+  r.setAttribute("data-wa-trimmed", "1");
+  edge = r;
+}
+window.__waTrimEdge = edge;
+return todo.length;
+"""
+
+
+def trim_chat_dom(driver, scroller, session, keep_px=TRIM_KEEP_PX):
+    try:
+        return driver.execute_script(TRIM_ROWS_JS, scroller, session, keep_px) or 0
+    except Exception as e:
+        print("⚠️ No se pudo podar el DOM:", e)
+        return 0
+
+
+def browser_metrics(driver):
+    """
+    Heap JS y nodos del renderer vía CDP (Performance.getMetrics). {} si el driver no habla CDP.
+    """
+    try:
+        metrics = driver.execute_cdp_cmd("Performance.getMetrics", {}).get("metrics")
+        if not metrics:  # el dominio Performance arranca apagado
+            driver.execute_cdp_cmd("Performance.enable", {})
+            metrics = driver.execute_cdp_cmd("Performance.getMetrics", {}).get("metrics")
+    except Exception:
+        return {}
+    m = {x["name"]: x["value"] for x in metrics}
+    return {
+        "heap_mb": m.get("JSHeapUsedSize", 0) / (1024 * 1024),
+        "nodes": int(m.get("Nodes", 0)),
+    }
+
+
+MEM_LOG_HEADERS = ["n", "chat", "seconds", "heap_mb", "nodes", "action"]
+
+
+def log_chat_memory(writer, n, title, seconds, mem, action=""):
+    """Una línea por chat: si el heap o la latencia crecen con n, el navegador se está hinchando."""
+    heap, nodes = mem.get("heap_mb", 0.0), mem.get("nodes", 0)
+    print(f"🧠 Heap {heap:.0f} MB | nodos {nodes} | chat en {seconds:.1f}s" + (f" | {action}" if action else ""))
+    if writer is not None:
+        writer.writerow([n, title, round(seconds, 2), round(heap, 1), nodes, action])
+
+
+# ======================================================
+# 1e) PERFILADO (tiempos por fase + reporte de la corrida)
+# ======================================================
+
+# Dos perf_counter por llamada: barato como para dejarlo siempre prendido
+PROFILING = True
+
+# fase -> [segundos, llamadas] del chat en curso (scrape_all_chats lo vacía en cada chat)
+PHASES = {}
+
+
+def add_phase(name, seconds):
+    st = PHASES.get(name)
+    if st is None:
+        st = PHASES[name] = [0.0, 0]
+    st[0] += seconds
+    st[1] += 1
+
+
+def timed_phase(name):
+    """Decorador: suma el tiempo de cada llamada a la fase `name` del chat en curso."""
+    def decorator(fn):
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            if not PROFILING:
+                return fn(*args, **kwargs)
+            t0 = time.perf_counter()
+            try:
+                return fn(*args, **kwargs)
+            finally:
+                add_phase(name, time.perf_counter() - t0)
+        return wrapper
+    return decorator
+
+
+@contextlib.contextmanager
+def phase(name):
+    t0 = time.perf_counter()
+    try:
+        yield
+    finally:
+        if PROFILING:
+            add_phase(name, time.perf_counter() - t0)
+
+
+def percentile(values, q):
+    # nearest-rank; alcanza para un reporte
+    if not values:
+        return 0.0
+    values = sorted(values)
+    return values[min(len(values) - 1, max(0, int(round(q / 100 * len(values))) - 1))]
+
+
+class RunReport:
+    """
+    Una fila por chat (estado, segundos, mensajes, comandos WebDriver, esperas, fases, heap)
+    y percentiles p50/p90/p99/max de la corrida. save() escribe <ruta>.json y <ruta>.csv.
+    """
+
+    PERCENTILES = (50, 90, 99)
+
+    def __init__(self, path=None):
+        self.path = path
+        self.chats = []
+        self.started = datetime.now()
+        self._t0 = None
+        self._counts = None
+        self._cmds0 = 0
+        self._waits0 = None
+
+    def start_chat(self, cmd_counts):
+        """cmd_counts: el dict de count_webdriver_commands del driver actual."""
+        PHASES.clear()
+        self._t0 = time.perf_counter()
+        self._counts = cmd_counts
+        self._cmds0 = cmd_counts["total"]
+        self._waits0 = dict(WAIT_STATS)
+
+    def end_chat(self, title, status, messages=0, mem=None):
+        if self._t0 is None:
+            return None
+        fixed, waited = wait_stats_since(self._waits0)
+        row = {
+            "chat": title,
+            "status": status,
+            "seconds": round(time.perf_counter() - self._t0, 3),
+            "messages": messages,
+            "cmds": self._counts["total"] - self._cmds0,
+            "waited_s": round(waited, 3),
+            "fixed_wait_s": round(fixed, 3),
+            "heap_mb": round((mem or {}).get("heap_mb", 0.0), 1),
+            "nodes": (mem or {}).get("nodes", 0),
+        }
+        for name, (secs, calls) in PHASES.items():
+            row[f"{name}_s"] = round(secs, 3)
+            row[f"{name}_n"] = calls
+        self.chats.append(row)
+        self._t0 = None
+        return row
+
+    def summary(self):
+        metrics = sorted({k for row in self.chats for k in row if k.endswith("_s")} | {"seconds", "messages", "cmds"})
+        agg = {}
+        for m in metrics:
+            values = [row.get(m, 0) for row in self.chats]
+            agg[m] = {f"p{q}": percentile(values, q) for q in self.PERCENTILES}
+            agg[m]["max"] = max(values) if values else 0
+            agg[m]["total"] = round(sum(values), 3)
+        return agg
+
+    def save(self, extra=None):
+        if not self.path:
+            return None
+        base, _ = os.path.splitext(self.path)
+        summary = self.summary()
+        with open(base + ".json", "w", encoding="utf-8") as f:
+            json.dump({
+                "run": {
+                    "started": self.started.isoformat(timespec="seconds"),
+                    "finished": datetime.now().isoformat(timespec="seconds"),
+                    "chats": len(self.chats),
+                    **(extra or {}),
+                },
+                "percentiles": summary,
+                "chats": self.chats,
+            }, f, indent=2, ensure_ascii=False)
+
+        columns = []
+        for row in self.chats:
+            columns += [k for k in row if k not in columns]
+        with open(base + ".csv", "w", newline="", encoding="utf-8") as f:
+            writer = csv.DictWriter(f, fieldnames=columns, restval=0)
+            writer.writeheader()
+            writer.writerows(self.chats)
+
+        print(f"📈 Reporte: {base}.json / {base}.csv")
+        for m in ("seconds", "cmds", "open_chat_s", "harvest_s", "scroll_s", "load_older_s", "enqueue_s"):
+            if m in summary:
+                s = summary[m]
+                print(f"   {m:<14} p50={s['p50']:<8} p90={s['p90']:<8} p99={s['p99']:<8} max={s['max']}")
+        return summary
+
+
+# ======================================================
+# 2a) EXCLUSIONES (reglas compiladas en un solo matcher)
+# ======================================================
+
+EXCLUDE_RULE_KINDS = ("exact", "normalized", "prefix", "regex", "number")
+PHONE_TITLE_RE = re.compile(r"^\+?[\d\s().-]{7,}$")
+# reglas regex que no se pueden unir con las demás: flags globales al principio ("(?i)foo" fuera
+# del primer lugar es un error), grupos con nombre (se repetirían) o referencias (\1 se renumera)
+STANDALONE_REGEX_RE = re.compile(r"^\(\?[aiLmsux]+\)|\(\?P[<=]|\\[1-9]")
+
+
+def rule_key(s):
+    """
+    Forma canónica para comparar títulos: sin mayúsculas, tildes, emojis ni espacios.
+    "Salida fija Mex - Setiembre / 2025 🇲🇽✈️🇵🇪" -> "salidafijamex-setiembre/2025"
+    """
+    s = unicodedata.normalize("NFKD", s or "").casefold()
+    return "".join(
+        ch for ch in s
+        if not ch.isspace() and not unicodedata.category(ch).startswith(("S", "M", "C"))
     )
 
 
+def digits_of(s):
+    return "".join(ch for ch in (s or "") if ch.isdigit())
+
+
+class ExclusionRules:
+    """
+    Reglas de exclusión de chats compiladas una vez; match() cuesta lo mismo con 10 o 1000 reglas:
+    - exact: título tal cual (set)
+    - normalized: por rule_key (set)
+    - prefix: rule_key del título empieza con el de la regla (trie por carácter)
+    - regex: todas juntas en una sola regex (re.I); las que no se pueden unir
+      (STANDALONE_REGEX_RE) se prueban de a una
+    - number: chats sin agendar ("+51 984 123 456"); por dígitos, alcanza con el final
+      ("984123456" excluye también "+51 984 123 456")
+    """
+
+    def __init__(self, exact=(), normalized=(), prefix=(), regex=(), number=()):
+        self.exact = {t.strip(): t for t in exact}
+        self.normalized = {rule_key(t): t for t in normalized if rule_key(t)}
+        self.trie = {}
+        for p in prefix:
+            key = rule_key(p)
+            if not key:
+                continue  # un prefijo vacío excluiría todo
+            node = self.trie
+            for ch in key:
+                node = node.setdefault(ch, {})
+            node[None] = p  # fin de un prefijo
+        joined, self.regex_alone = [], []
+        for r in regex:
+            compiled = re.compile(r, re.I)  # cada regla se valida sola: el error dice cuál es
+            if STANDALONE_REGEX_RE.search(r):
+                self.regex_alone.append(compiled)
+            else:
+                joined.append(r)
+        self.regex = re.compile("|".join(f"(?:{r})" for r in joined), re.I) if joined else None
+        self.numbers = {digits_of(n): n for n in number if digits_of(n)}
+        self.number_lengths = sorted({len(d) for d in self.numbers})
+        self.size = len(self.exact) + len(self.normalized) + len(prefix) + len(regex) + len(self.numbers)
+        self.cache = {}  # título -> regla (o None); el panel repite los mismos títulos
+
+    def match(self, title):
+        """La regla que excluye a `title` ("prefix: Salida fija Mex") o None."""
+        if title in self.cache:
+            return self.cache[title]
+        self.cache[title] = hit = self._match(title)
+        return hit
+
+    def _match(self, title):
+        title = (title or "").strip()
+        if title in self.exact:
+            return f"exact: {self.exact[title]}"
+
+        key = rule_key(title)
+        if key in self.normalized:
+            return f"normalized: {self.normalized[key]}"
+
+        node = self.trie
+        for ch in key:
+            if None in node:
+                break
+            node = node.get(ch)
+            if node is None:
+                break
+        if node is not None and None in node:
+            return f"prefix: {node[None]}"
+
+        if self.regex is not None:
+            m = self.regex.search(title)
+            if m:
+                return f"regex: {m.group(0)}"
+        for rx in self.regex_alone:
+            m = rx.search(title)
+            if m:
+                return f"regex: {m.group(0)}"
+
+        if self.numbers and PHONE_TITLE_RE.match(title):
+            d = digits_of(title)
+            for n in self.number_lengths:
+                if d[-n:] in self.numbers:
+                    return f"number: {self.numbers[d[-n:]]}"
+        return None
+
+
+def load_exclusion_rules(path=None):
+    """
+    Sin archivo: EXCLUDE_TITLES (normalized) + EXCLUDE_PREFIXES (prefix).
+    Con --exclude-rules archivo.json, las reglas salen de ahí (reemplazan a las de arriba):
+        {"exact": [...], "normalized": [...], "prefix": ["Salida fija Mex"],
+         "regex": ["^AÑO NUEVO EN PERÚ"], "number": ["+51 984 123 456"]}
+    """
+    if not path:
+        return ExclusionRules(normalized=EXCLUDE_TITLES, prefix=EXCLUDE_PREFIXES)
+    with open(path, encoding="utf-8") as f:
+        config = json.load(f)
+    unknown = set(config) - set(EXCLUDE_RULE_KINDS)
+    if unknown:
+        raise ValueError(f"reglas desconocidas en {path}: {', '.join(sorted(unknown))}")
+    try:
+        return ExclusionRules(**{k: list(v) for k, v in config.items()})
+    except re.error as e:
+        raise ValueError(f"regex inválida en {path}: {e.pattern!r} ({e})") from e
+
+
+EXCLUSIONS = load_exclusion_rules()
+
+
 # ======================================================
 # 2) WHATSAPP – PRIMER CHAT
 # ======================================================
@@ -107,71 +828,112 @@ def get_first_chat_name(driver):
     return None
 
 
-def open_chat_by_title(driver, contact):
-    user = WebDriverWait(driver, 20).until(
-        EC.element_to_be_clickable(
-            (By.XPATH, f'//*[@id="pane-side"]//span[contains(@title, "{contact}")]')
-        )
-    )
-    driver.execute_script("arguments[0].scrollIntoView({block:'center'});", user)
-    user.click()
-    time.sleep(2)
+CHAT_LIST_JS = r"""
+const pane = document.getElementById("pane-side");
+if (!pane) return [];
+const senderRe = /^([^:\n]{1,40}):\s/;
+const selfRe = /^(t[uú]|you|borrador|draft)$/i;
+const timeRe = /^(\d{1,2}:\d{2}(\s?[ap]\.?\s?m\.?)?|ayer|yesterday|lunes|martes|mi[eé]rcoles|jueves|viernes|s[aá]bado|domingo|monday|tuesday|wednesday|thursday|friday|saturday|sunday|\d{1,2}\/\d{1,2}\/\d{2,4})$/i;
+const out = [];
+const seen = new Set();
+
+for (const row of pane.querySelectorAll("div[role='row']")) {
+  // el nombre/número del chat casi siempre es el primer span con title
+  let title = "";
+  for (const s of row.querySelectorAll("span[title]")) {
+    const t = (s.getAttribute("title") || "").trim();
+    if (t) { title = t; break; }
+  }
+  if (!title || title.includes("\n") || [...title].length > 60) continue;
+  if (title === "Archivados" || title === "WhatsApp") continue;
+  if (seen.has(title)) continue;
+  seen.add(title);
+
+  // hora / "Ayer" / día / fecha de la última actividad
+  let activity = "";
+  for (const el of row.querySelectorAll("div, span")) {
+    if (el.children.length) continue;
+    const t = (el.textContent || "").trim();
+    if (timeRe.test(t)) { activity = t; break; }
+  }
+
+  // badge "3 mensajes no leídos"
+  let unread = 0;
+  for (const el of row.querySelectorAll("[aria-label]")) {
+    const label = el.getAttribute("aria-label") || "";
+    if (/no le[ií]dos?|unread/i.test(label)) { unread = parseInt(label, 10) || 1; break; }
+  }
+
+  // preview del último mensaje: el último span[title] que no es el título
+  const spans = row.querySelectorAll("span[title]");
+  const preview = spans.length > 1 ? (spans[spans.length - 1].getAttribute("title") || "").trim() : "";
+
+  // grupo: ícono de avatar por defecto, data-id "...@g.us" o preview "Remitente: mensaje"
+  let group = "";
+  if (row.querySelector("[data-icon='default-group'],[data-icon='default-community']")) {
+    group = "icon";
+  } else {
+    const idEl = row.closest("[data-id]") || row.querySelector("[data-id]");
+    if (idEl && (idEl.getAttribute("data-id") || "").includes("@g.us")) {
+      group = "data-id";
+    } else {
+      const m = preview.match(senderRe);
+      if (m && !selfRe.test(m[1].trim())) group = "sender";
+    }
+  }
+  // fijado: queda arriba aunque su última actividad sea vieja
+  const pinned = !!row.querySelector("[data-icon^='pinned']");
+  out.push({title: title, unread: unread, activity: activity, preview: preview, group: group, pinned: pinned});
+}
+return out;
+"""
 
-def get_visible_chat_titles(driver):
+
+def get_visible_chats(driver, apply_exclusions=True):
     """
-    Devuelve los títulos (nombres) de chats visibles en el panel izquierdo,
-    en el orden en que aparecen (WhatsApp: más recientes arriba).
+    Chats visibles en el panel izquierdo, en orden (WhatsApp: más recientes arriba),
+    en un solo execute_script: [{title, unread, activity, preview, date, group, pinned}].
+    group: señal que delata un grupo ("icon", "data-id", "sender") o "" (ver classify_groups).
+    pinned: chat fijado (arriba de todo sin importar su última actividad).
+    Ya vienen filtrados: títulos raros, "Archivados"/"WhatsApp" y, con apply_exclusions, EXCLUSIONS.
     """
-    pane = WebDriverWait(driver, 20).until(
+    WebDriverWait(driver, 20).until(
         EC.presence_of_element_located((By.ID, "pane-side"))
     )
-     # Filas del listado de chats (WhatsApp suele usar role="row")
-    rows = pane.find_elements(By.XPATH, ".//div[@role='row']")
-
-    titles = []
-    seen = set()
-
-    for row in rows:
-        try:
-            # Dentro de cada fila, el nombre/número del chat casi siempre es el primer span con title
-            name_span = row.find_element(By.XPATH, ".//span[@title and normalize-space(@title)!='']")
-            title = (name_span.get_attribute("title") or "").strip()
-
-            if not title:
-                continue
-            if "\n" in title:
-                continue
-            if len(title) > 60:
-                continue
-            if title in ("Archivados", "WhatsApp"):
-                continue
-
-            if title not in seen:
-                seen.add(title)
-                titles.append(title)
+    chats = driver.execute_script(CHAT_LIST_JS) or []
+    if apply_exclusions:
+        chats = [c for c in chats if not EXCLUSIONS.match(c["title"])]
+    for c in chats:
+        c["date"] = parse_pane_date(c["activity"])
+    return chats
 
-        except Exception:
-            # Si esa fila no tiene span title “usable”, la saltamos
-            continue
 
-    return titles
-    
+def get_visible_chat_titles(driver):
+    """
+    Devuelve los títulos (nombres) de chats visibles en el panel izquierdo,
+    en el orden en que aparecen (WhatsApp: más recientes arriba).
+    """
+    return [c["title"] for c in get_visible_chats(driver)]
 
 
-def scroll_left_pane(driver, step=900):
+def scroll_left_pane(driver, step=900, since=None):
     """
     Baja el panel izquierdo para cargar chats más antiguos.
+    Con `since`: devuelve False (y no baja más) si la última actividad visible ya es anterior al corte.
     """
     pane = WebDriverWait(driver, 20).until(
         EC.presence_of_element_located((By.ID, "pane-side"))
     )
+    if since is not None:
+        oldest = pane_oldest_activity(driver)
+        if oldest is not None and oldest < since:
+            print(f"📅 Panel: última actividad {oldest} < {since}. No se baja más.")
+            return False
     driver.execute_script("arguments[0].scrollTop = arguments[0].scrollTop + arguments[1];", pane, step)
-    time.sleep(1.2)
-########################################## normalizar titulo
-def norm_title(s: str) -> str:
-    return re.sub(r"\s+", " ", (s or "").strip()).lower()
-EXCLUDE_TITLES_NORM = {norm_title(t) for t in EXCLUDE_TITLES}
+    pause(driver, pane, 1.2)
+    return True
 ######################################## detector del banner
+@timed_phase("banner")
 def end_to_end_banner_present(driver) -> bool:
     """
     True si aparece banner de corte dentro del chat:
@@ -195,116 +957,543 @@ def end_to_end_banner_present(driver) -> bool:
     except Exception:
         return False
 
+
 # ======================================================
-# 3) FECHA (si luego quieres filtrar)
+# 2b) NAVEGACIÓN (abrir un chat por título exacto)
 # ======================================================
 
-def parse_date_from_meta(meta: str):
-    if not meta:
-        return None
-    m = re.search(r"\b(\d{1,2})/(\d{1,2})/(\d{2,4})\b", meta)
-    if not m:
-        return None
+# buscador de chats del panel izquierdo (el selector cambió entre versiones de WhatsApp Web)
+SEARCH_BOX_CSS = "#side div[contenteditable='true'], #side input[role='textbox'], #side input[type='text']"
 
-    d1, d2, y = m.group(1), m.group(2), m.group(3)
-    y = int("20" + y) if len(y) == 2 else int(y)
+# cómo se abrió cada chat (panel / search / link)
+NAV_STATS = {"panel": 0, "search": 0, "link": 0}
 
-    day = int(d1)
-    month = int(d2)
+# span del panel (o de los resultados de búsqueda) cuyo title es exactamente arguments[0]
+FIND_CHAT_ROW_JS = r"""
+const pane = document.getElementById("pane-side");
+if (!pane) return null;
+for (const s of pane.querySelectorAll("span[title]")) {
+  if ((s.getAttribute("title") || "").trim() === arguments[0]) return s;
+}
+return null;
+"""
 
-    try:
-        return datetime(y, month, day).date()
-    except ValueError:
-        return None
+CHAT_HEADER_JS = r"""
+const header = document.querySelector("#main header");
+if (!header) return [];
+return [...header.querySelectorAll("span")]
+  .map(s => (s.getAttribute("title") || s.textContent || "").trim())
+  .filter(Boolean);
+"""
 
 
-# ======================================================
-# 4) CLICK "mensajes anteriores del teléfono"
-# ======================================================
+def search_query(title):
+    # ChromeDriver no puede tipear fuera del BMP (emojis): se busca con el resto del título
+    return re.sub(r"\s+", " ", "".join(ch for ch in title if ord(ch) <= 0xFFFF)).strip()
 
-def click_load_older_if_present(driver):
-    """
-    Si aparece el aviso: 'Haz clic aquí para obtener mensajes anteriores de tu teléfono',
-    hace click y espera. Devuelve True si clickeó.
-    """
-    try:
-        # Caso común: un botón que contiene ese texto
-        btns = driver.find_elements(
-            By.XPATH,
-            "//button[.//div[contains(., 'Haz clic aquí para obtener mensajes anteriores')]]"
-        )
-        if btns:
-            driver.execute_script("arguments[0].scrollIntoView({block:'center'});", btns[0])
-            time.sleep(0.3)
-            btns[0].click()
-            time.sleep(2.5)
-            return True
 
-        # Fallback: a veces es un div/spam clickeable
-        divs = driver.find_elements(
-            By.XPATH,
-            "//*[contains(., 'Haz clic aquí para obtener mensajes anteriores') and (self::div or self::span)]"
-        )
-        if divs:
-            driver.execute_script("arguments[0].scrollIntoView({block:'center'});", divs[0])
-            time.sleep(0.3)
-            divs[0].click()
-            time.sleep(2.5)
-            return True
+def click_chat_row(driver, title):
+    el = driver.execute_script(FIND_CHAT_ROW_JS, title)
+    if el is None:
+        return False
+    driver.execute_script("arguments[0].scrollIntoView({block:'center'});", el)
+    el.click()
+    return True
 
-    except Exception:
-        pass
 
-    return False
+def clear_search(driver, box=None):
+    box = box or driver.find_element(By.CSS_SELECTOR, SEARCH_BOX_CSS)
+    box.click()
+    box.send_keys(Keys.CONTROL, "a")
+    box.send_keys(Keys.BACKSPACE)
 
 
+def open_chat_via_search(driver, title, timeout=5):
+    """Tipea el título en el buscador y hace click en el resultado exacto; después limpia la búsqueda."""
+    query = search_query(title)
+    if not query:
+        return False
+    box = driver.find_element(By.CSS_SELECTOR, SEARCH_BOX_CSS)
+    clear_search(driver, box)
+    box.send_keys(query)
+    try:
+        el = WebDriverWait(driver, timeout, poll_frequency=0.1).until(
+            lambda d: d.execute_script(FIND_CHAT_ROW_JS, title)
+        )
+        el.click()
+        return True
+    except TimeoutException:
+        return False
+    finally:
+        # sin esto el panel queda mostrando resultados y el recorrido por el panel se pierde
+        clear_search(driver, box)
 
 
-#################################################################################################################### scroller
+def open_chat_via_link(driver, title, timeout=60):
+    """Chats sin agendar ("+51 984 123 456"): WHATSAPP_URL/send?phone=... (recarga WhatsApp Web)."""
+    driver.get(f"{WHATSAPP_URL}send?phone={digits_of(title)}")
+    wait_for_whatsapp_login(driver, interactive=False, timeout=timeout)
+    return True
 
-def get_chat_scroller(driver):
-    """
-    Contenedor REAL que scrollea los mensajes del chat.
-    (confirmado por tu consola: policy 'wa.web.conversation.messages')
-    """
-    return WebDriverWait(driver, 25).until(
-        EC.presence_of_element_located(
-            (By.CSS_SELECTOR, "div.copyable-area [data-scrolltracepolicy='wa.web.conversation.messages']")
+
+def opened_chat_is(driver, title, timeout=3):
+    """True si la cabecera del chat abierto muestra exactamente `title`."""
+    try:
+        WebDriverWait(driver, timeout, poll_frequency=0.1).until(
+            lambda d: title in (d.execute_script(CHAT_HEADER_JS) or [])
         )
-    )
+        return True
+    except TimeoutException:
+        return False
 
-def get_scroll_metrics(driver, el):
-    return driver.execute_script(
-        "return {st: arguments[0].scrollTop, sh: arguments[0].scrollHeight, ch: arguments[0].clientHeight};",
-        el
-    )
-def scroll_chat_step(driver, scroller):
-    # métricas
-    st = driver.execute_script("return arguments[0].scrollTop;", scroller) or 0
-    sh = driver.execute_script("return arguments[0].scrollHeight;", scroller) or 0
-    ch = driver.execute_script("return arguments[0].clientHeight;", scroller) or 0
-    delta = sh - ch
 
-    step = max(120, min(900, int(delta * 0.8)))
+@timed_phase("open_chat")
+def open_chat_by_title(driver, contact):
+    """
+    Abre el chat cuyo título es exactamente `contact` y lo verifica contra la cabecera:
+    1) panel: la fila ya está a la vista (un execute_script, sin XPath contains());
+    2) search: buscador de WhatsApp, no importa dónde quedó el chat en la lista virtualizada;
+    3) link: solo números sin agendar, send?phone= (recarga la página: último recurso).
+    Lanza RuntimeError si ninguno deja abierto ese chat.
+    """
+    title = contact.strip()
+    openers = [("panel", click_chat_row), ("search", open_chat_via_search)]
+    if PHONE_TITLE_RE.match(title):
+        openers.append(("link", open_chat_via_link))
 
-    if st > 5:
-        driver.execute_script(
-            "arguments[0].scrollTop = Math.max(0, arguments[0].scrollTop - arguments[1]);",
-            scroller,
-            step
-        )
-        time.sleep(1.2)
-        return "scrolled"
+    errors = []
+    for via, opener in openers:
+        try:
+            if opener(driver, title) and opened_chat_is(driver, title):
+                NAV_STATS[via] += 1
+                break
+        except Exception as e:  # timeout, selector viejo, elemento que se fue del DOM...
+            errors.append(f"{via}: {e.__class__.__name__}")
     else:
-        # arriba; espera a que cargue más
-        time.sleep(2.5)
-        return "at_top"
-########################################################################################################################
-def get_message_bubble_from_meta_el(meta_el):
-    # sube al contenedor del mensaje (burbuja) más cercano
-    return meta_el.find_element(By.XPATH, "./ancestor::div[@role='row'][1]")
+        raise RuntimeError(f"no se pudo abrir '{title}'" + (f" ({', '.join(errors)})" if errors else ""))
 
-######################################################### audio
+    # Espera a que el chat abierto tenga filas (antes: sleep fijo de 2 s)
+    t0 = time.time()
+    if ADAPTIVE_WAITS:
+        try:
+            WebDriverWait(driver, 2, poll_frequency=0.1).until(
+                EC.presence_of_element_located((By.CSS_SELECTOR, "div.copyable-area [data-scrolltracepolicy='wa.web.conversation.messages'] div[role='row']"))
+            )
+        except TimeoutException:
+            pass
+    else:
+        time.sleep(2)
+    record_wait(2, t0)
+
+
+# ======================================================
+# 3) FECHA (filtro --since / --until)
+# ======================================================
+
+def parse_date_from_meta(meta: str):
+    return parse_metas((meta,))[1][0]
+
+
+# "[10:42, 12/3/2025]", "[9:05 p. m., 12/3/25]", "[9:05 PM, 3/12/2025]"
+META_HEAD_RE = re.compile(r"\[(\d{1,2}):(\d{2})\s*([ap])?[^,\]]*,\s*(\d{1,2})/(\d{1,2})/(\d{2,4})\]", re.I)
+DATE_RE = re.compile(r"\b(\d{1,2})/(\d{1,2})/(\d{2,4})\b")
+
+# cabecera "[hora, fecha]" -> (timestamp, fecha): muchos mensajes comparten minuto
+META_CACHE = {}
+META_CACHE_MAX = 100_000
+
+
+def parse_meta_head(head):
+    m = META_HEAD_RE.match(head)
+    if m:
+        hh, mm, ampm, d, mo, y = m.groups()
+    else:
+        # etiquetas sueltas ("12/3/2025" del panel, metas sin hora)
+        m = DATE_RE.search(head)
+        if not m:
+            return None, None
+        (d, mo, y), hh = m.groups(), None
+
+    day, month, year = int(d), int(mo), int(y) + (2000 if len(y) == 2 else 0)
+    if month > 12 and day <= 12:  # teléfono en formato US (m/d/yy)
+        day, month = month, day
+    try:
+        date = datetime(year, month, day).date()
+    except ValueError:
+        return None, None
+    if hh is None:
+        return None, date
+
+    hh = int(hh)
+    if ampm:  # "9:05 p. m." / "9:05 PM"
+        hh = hh % 12 + (12 if ampm.lower() == "p" else 0)
+    try:
+        return datetime(year, month, day, hh, int(mm)), date
+    except ValueError:
+        return None, date
+
+
+def parse_metas(metas):
+    """
+    Parseo en bloque de metas "[10:42, 12/3/2025] Juan: " -> (timestamps, dates, senders).
+    Cabecera y remitente se cachean: en un chat se repiten los mismos pocos valores.
+    Lo que no se puede parsear queda en None.
+    """
+    timestamps, dates, senders = [], [], []
+    cache = META_CACHE
+    if len(cache) > META_CACHE_MAX:
+        cache.clear()
+    sender_cache = {}
+
+    for meta in metas:
+        meta = meta or ""
+        cut = meta.find("]") + 1  # 0 si no hay corchete
+        head = meta[:cut] if cut else meta
+
+        parsed = cache.get(head)
+        if parsed is None:
+            parsed = cache[head] = parse_meta_head(head)
+        timestamps.append(parsed[0])
+        dates.append(parsed[1])
+
+        tail = meta[cut:] if cut else ""
+        sender = sender_cache.get(tail)
+        if sender is None:
+            sender = sender_cache[tail] = tail.strip().rstrip(":").rstrip() or None
+        senders.append(sender)
+    return timestamps, dates, senders
+
+
+def parse_cli_date(s):
+    """
+    --since / --until: "2025-03-01", "1/3/2025" (día/mes) o relativo "7d" (hace 7 días).
+    """
+    s = (s or "").strip().lower()
+    if not s:
+        return None
+    m = re.fullmatch(r"(\d+)d", s)
+    if m:
+        return datetime.now().date() - timedelta(days=int(m.group(1)))
+    try:
+        return datetime.strptime(s, "%Y-%m-%d").date()
+    except ValueError:
+        pass
+    d = parse_date_from_meta(s)
+    if d is None:
+        raise ValueError(f"Fecha inválida: {s!r} (usa YYYY-MM-DD, dd/mm/yyyy o Nd)")
+    return d
+
+
+def in_date_window(d, since=None, until=None):
+    # Sin fecha (p. ej. audio sin meta) no podemos decidir: se queda
+    if d is None:
+        return True
+    if since and d < since:
+        return False
+    if until and d > until:
+        return False
+    return True
+
+
+WEEKDAYS = {
+    "lunes": 0, "martes": 1, "miércoles": 2, "miercoles": 2, "jueves": 3, "viernes": 4, "sábado": 5, "sabado": 5,
+    "domingo": 6, "monday": 0, "tuesday": 1, "wednesday": 2, "thursday": 3, "friday": 4, "saturday": 5,
+    "sunday": 6,
+}
+
+
+def parse_pane_date(label, today=None):
+    """
+    Fecha de la última actividad que muestra el panel izquierdo:
+    "10:42" (hoy), "Ayer", "lunes" (última semana) o "12/3/2025".
+    """
+    today = today or datetime.now().date()
+    label = (label or "").strip().lower()
+    if not label:
+        return None
+    if re.match(r"^\d{1,2}:\d{2}", label):
+        return today
+    if label in ("ayer", "yesterday"):
+        return today - timedelta(days=1)
+    if label in WEEKDAYS:
+        back = (today.weekday() - WEEKDAYS[label]) % 7 or 7
+        return today - timedelta(days=back)
+    return parse_date_from_meta(label)
+
+
+def pane_oldest_activity(driver):
+    """
+    Fecha más antigua de última actividad entre las filas visibles del panel (una sola llamada).
+    Los fijados no cuentan: están arriba por estar fijados, no por recientes, y uno viejo
+    cortaría el recorrido con chats recientes todavía más abajo.
+    """
+    dates = [
+        c["date"] for c in get_visible_chats(driver, apply_exclusions=False)
+        if c["date"] is not None and not c.get("pinned")
+    ]
+    return min(dates) if dates else None
+
+
+PANE_TIME_RE = re.compile(r"^(\d{1,2}):(\d{2})\s*([ap])?", re.I)
+
+
+def pane_activity_key(label, today=None):
+    """
+    (fecha, hh, mm) de la última actividad del panel, comparable con meta_sort_key.
+    Solo los chats de hoy muestran la hora; el resto queda en (fecha, 0, 0).
+    """
+    d = parse_pane_date(label, today)
+    if d is None:
+        return None
+    m = PANE_TIME_RE.match((label or "").strip())
+    if not m:
+        return (d, 0, 0)
+    hh, mm, ampm = int(m.group(1)), int(m.group(2)), m.group(3)
+    if ampm:
+        hh = hh % 12 + (12 if ampm.lower() == "p" else 0)
+    return (d, hh, mm)
+
+
+def activity_stamp(label, today=None):
+    """
+    pane_activity_key como texto para guardar en el checkpoint: "2025-03-12 10:42" si el panel
+    muestra la hora (chats de hoy), "2025-03-12" si solo se sabe el día.
+    """
+    key = pane_activity_key(label, today)
+    if key is None:
+        return None
+    if PANE_TIME_RE.match((label or "").strip()):
+        return f"{key[0].isoformat()} {key[1]:02d}:{key[2]:02d}"
+    return key[0].isoformat()
+
+
+# ======================================================
+# 3b) PLANIFICADOR (qué chats se abren primero)
+# ======================================================
+
+# criterios de --order; los empates quedan en el orden del panel
+SCHEDULE_CRITERIA = ("unread", "recent", "changed")
+
+
+# --groups: qué hacer con los grupos detectados en el panel, sin abrirlos
+#   skip: no se abren los delatados por ícono o data-id; los que solo tienen "Remitente: " en el
+#         preview (puede ser un mensaje tipo "Ojo: ...") se abren igual, al final de la cola
+#   last: se abren después de todos los chats individuales (lista el panel entero antes)
+#   keep: como cualquier chat
+GROUP_POLICIES = ("skip", "last", "keep")
+GROUP_POLICY = "skip"
+STRONG_GROUP_SIGNALS = ("icon", "data-id")
+
+
+def classify_groups(chats, cache):
+    """
+    Deja en c["group"] la señal más fuerte vista para ese título en la corrida y la guarda en
+    `cache` (título -> señal). Hace falta recordarla: el ícono por defecto no está si el grupo
+    tiene foto y el preview cambia con cada mensaje.
+    """
+    for c in chats:
+        prev = cache.get(c["title"], "")
+        if prev in STRONG_GROUP_SIGNALS or not c["group"]:
+            c["group"] = prev
+        cache[c["title"]] = c["group"]
+    return chats
+
+
+def parse_order(s):
+    """
+    --order: "pane" (orden del panel, como siempre) o criterios separados por coma,
+    ej. "unread,changed,recent".
+    """
+    s = (s or "pane").strip().lower()
+    if s == "pane":
+        return ()
+    order = tuple(p.strip() for p in s.split(",") if p.strip())
+    bad = [p for p in order if p not in SCHEDULE_CRITERIA]
+    if bad or not order:
+        raise ValueError(f"Orden inválido: {s!r} (usa pane o {', '.join(SCHEDULE_CRITERIA)})")
+    return order
+
+
+def enumerate_chat_list(driver, pane_step=1200, max_scrolls=200, since=None):
+    """
+    Lista el panel entero sin abrir ningún chat (un CHAT_LIST_JS por paso de scroll):
+    [{title, unread, activity, date, group, pane_index}] en orden del panel.
+    Con `since` para en el corte.
+    Deja el panel arriba.
+    """
+    pane = WebDriverWait(driver, 20).until(EC.presence_of_element_located((By.ID, "pane-side")))
+    driver.execute_script("arguments[0].scrollTop = 0;", pane)
+    pause(driver, pane, 1.2)
+
+    found = {}
+    for _ in range(max_scrolls):
+        offset = driver.execute_script("return arguments[0].scrollTop;", pane)
+        for c in get_visible_chats(driver):
+            if c["title"] not in found:
+                c["pane_index"] = len(found)
+                found[c["title"]] = c
+        if not scroll_left_pane(driver, pane_step, since=since):
+            break
+        if driver.execute_script("return arguments[0].scrollTop;", pane) == offset:
+            break  # fondo del panel
+
+    driver.execute_script("arguments[0].scrollTop = 0;", pane)
+    return list(found.values())
+
+
+def chat_changed(chat, newest_meta):
+    """
+    True si el chat tiene algo posterior a lo guardado en el checkpoint: nunca se scrapeó,
+    tiene no leídos o su última actividad es más nueva que el último mensaje guardado.
+    Sin hora en el panel (días anteriores) solo se puede comparar la fecha.
+    """
+    if chat["unread"] or not newest_meta:
+        return True
+    saved = meta_sort_key(newest_meta)
+    key = pane_activity_key(chat["activity"])
+    if saved is None or key is None:
+        return True
+    if key[0] != saved[0]:
+        return key[0] > saved[0]
+    return PANE_TIME_RE.match(chat["activity"].strip()) is not None and key > saved
+
+
+def chat_unchanged(chat, state):
+    """
+    --sync: True si la fila del panel es la misma que la última vez que se guardó el chat
+    (mismo preview, misma última actividad, sin no leídos), así que no hace falta abrirlo.
+    state: fila de checkpoint_chat_states. "10:42" pasa a "Ayer" al día siguiente: si uno de
+    los dos sellos no tiene hora se compara solo el día.
+    """
+    if not state or chat["unread"] or state["truncated"] or not state["completed"]:
+        return False
+    if not state["activity"] or (chat.get("preview") or "") != (state["preview"] or ""):
+        return False
+    now = activity_stamp(chat["activity"])
+    if now is None:
+        return False
+    if " " in now and " " in state["activity"]:
+        return now == state["activity"]
+    return now[:10] == state["activity"][:10]
+
+
+def prioritize_chats(chats, order, newest=None, groups_last=False):
+    """
+    Cola de trabajo: los chats de enumerate_chat_list ordenados por los criterios de `order`
+    (parse_order). newest: {título: newest_meta} del checkpoint, para "changed".
+    groups_last: los grupos (c["group"]) van después de todos los chats individuales.
+    """
+    newest = newest or {}
+
+    def sort_key(c):
+        key = [1 if groups_last and c.get("group") else 0]
+        for crit in order:
+            if crit == "unread":
+                key.append(0 if c["unread"] else 1)
+            elif crit == "recent":
+                k = pane_activity_key(c["activity"])
+                key.append(-(k[0].toordinal() * 1440 + k[1] * 60 + k[2]) if k else 0)
+            elif crit == "changed":
+                key.append(0 if chat_changed(c, newest.get(c["title"])) else 1)
+        key.append(c["pane_index"])
+        return key
+
+    return sorted(chats, key=sort_key)
+
+
+
+# ======================================================
+# 4) CLICK "mensajes anteriores del teléfono"
+# ======================================================
+
+@timed_phase("load_older")
+def click_load_older_if_present(driver):
+    """
+    Si aparece el aviso: 'Haz clic aquí para obtener mensajes anteriores de tu teléfono',
+    hace click y espera. Devuelve True si clickeó.
+    """
+    try:
+        # Caso común: un botón que contiene ese texto
+        btns = driver.find_elements(
+            By.XPATH,
+            "//button[.//div[contains(., 'Haz clic aquí para obtener mensajes anteriores')]]"
+        )
+        if btns:
+            driver.execute_script("arguments[0].scrollIntoView({block:'center'});", btns[0])
+            pause(driver, None, 0.3)  # scrollIntoView es síncrono: no hay nada que esperar
+            btns[0].click()
+            pause(driver, get_chat_scroller(driver), 2.5)
+            return True
+
+        # Fallback: a veces es un div/spam clickeable
+        divs = driver.find_elements(
+            By.XPATH,
+            "//*[contains(., 'Haz clic aquí para obtener mensajes anteriores') and (self::div or self::span)]"
+        )
+        if divs:
+            driver.execute_script("arguments[0].scrollIntoView({block:'center'});", divs[0])
+            pause(driver, None, 0.3)  # scrollIntoView es síncrono: no hay nada que esperar
+            divs[0].click()
+            pause(driver, get_chat_scroller(driver), 2.5)
+            return True
+
+    except Exception:
+        pass
+
+    return False
+
+
+
+
+#################################################################################################################### scroller
+
+def get_chat_scroller(driver):
+    """
+    Contenedor REAL que scrollea los mensajes del chat.
+    (confirmado por tu consola: policy 'wa.web.conversation.messages')
+    """
+    return WebDriverWait(driver, 25).until(
+        EC.presence_of_element_located(
+            (By.CSS_SELECTOR, "div.copyable-area [data-scrolltracepolicy='wa.web.conversation.messages']")
+        )
+    )
+
+def get_scroll_metrics(driver, el):
+    return driver.execute_script(
+        "return {st: arguments[0].scrollTop, sh: arguments[0].scrollHeight, ch: arguments[0].clientHeight};",
+        el
+    )
+@timed_phase("scroll")
+def scroll_chat_step(driver, scroller):
+    # métricas (una sola llamada)
+    m = get_scroll_metrics(driver, scroller) or {}
+    st, sh, ch = m.get("st") or 0, m.get("sh") or 0, m.get("ch") or 0
+    delta = sh - ch
+
+    step = max(120, min(900, int(delta * 0.8)))
+
+    if st > 5:
+        driver.execute_script(
+            "arguments[0].scrollTop = Math.max(0, arguments[0].scrollTop - arguments[1]);",
+            scroller,
+            step
+        )
+        # Si arriba todavía queda más de una pantalla ya cargada, WhatsApp no va a traer nada nuevo:
+        # solo damos un respiro corto. Cerca del tope sí esperamos (hasta 1.2 s) a que cargue.
+        near_top = (st - step) <= ch
+        pause(driver, scroller, 1.2, timeout=None if near_top else 0.25)
+        return "scrolled"
+    else:
+        # arriba; espera a que cargue más
+        pause(driver, scroller, 2.5)
+        return "at_top"
+########################################################################################################################
+def get_message_bubble_from_meta_el(meta_el):
+    # sube al contenedor del mensaje (burbuja) más cercano
+    return meta_el.find_element(By.XPATH, "./ancestor::div[@role='row'][1]")
+
+######################################################### audio
+@timed_phase("bubble_kind")
 def bubble_kind(bubble):
     # AUDIO: tu debug confirmó data-icon audio-play
     if bubble.find_elements(By.XPATH, ".//*[@data-icon='audio-play' or @data-icon='ptt-play']"):
@@ -333,21 +1522,302 @@ def meta_from_bubble(bubble):
         return (meta_els[0].get_attribute("data-pre-plain-text") or "").strip()
     return ""
 
+# ======================================================
+# 5) HARVEST EN UNA SOLA LLAMADA (JS)
+# ======================================================
+
+# "js": un solo execute_script por iteración recorre el DOM del chat dentro del navegador.
+# "py": recorrido original con find_elements + get_attribute/.text por elemento (muchas idas y vueltas).
+HARVEST_MODE = "js"
+
+# True: cada paso solo lee las filas cargadas por encima de la marca de agua (la fila más alta
+# ya procesada) y salta las ya leídas => trabajo lineal en el largo del chat.
+# False: cada paso vuelve a leer todo lo cargado (cuadrático); queda para comparar.
+INCREMENTAL_HARVEST = True
+
+HARVEST_JS = r"""
+const scroller = arguments[0];
+const session = arguments[1] || "";
+const watermark = arguments[2] || "";
+const withMedia = !!arguments[3];
+const MAX_ROW_TRIES = 3;
+const clean = (s) => (s || "").trim();
+
+function kindOf(row) {
+  if (row.querySelector("[data-icon='audio-play'],[data-icon='ptt-play']")) return "AUDIO";
+  if (row.querySelector("[role='button'][aria-label*='Abrir foto']")) return "ADJUNTO";
+  if (row.querySelector("[role='button'][aria-label*='Descargar'],[role='button'][aria-label*='Download']")) return "ADJUNTO";
+  if (row.querySelector("[role='button'][aria-label*='Reenviar archivo']")) return "ADJUNTO";
+  if (!clean(row.innerText) && row.querySelector("img")) return "ADJUNTO";
+  return "";
+}
+
+// Metadatos de audios / adjuntos que la burbuja ya muestra (--media). Sin clicks ni descargas.
+const CLOCK_RE = /^\d{1,2}:\d{2}(?::\d{2})?$/;
+const SIZE_RE = /\d+(?:[.,]\d+)?\s?(?:bytes|B|kB|KB|MB|GB)\b/;
+const FILE_RE = /^[^\/\\:*?"<>|]+\.[A-Za-z0-9]{1,5}$/;
+function mediaOf(row, kind, metaEls) {
+  const m = {icons: []};
+  const leaves = [];
+  for (const el of row.querySelectorAll("span, div")) {
+    if (el.children.length) continue;
+    const s = clean(el.innerText);
+    if (s) leaves.push(s);
+  }
+  // audio: la primera hora m:ss de la burbuja es la duración (la última es la hora del mensaje)
+  const clocks = leaves.filter((s) => CLOCK_RE.test(s));
+  if (kind === "AUDIO" && clocks.length > 1) m.duration = clocks[0];
+  const size = leaves.find((s) => SIZE_RE.test(s));
+  if (size) m.size = size.match(SIZE_RE)[0];
+  for (const el of row.querySelectorAll("[title]")) {
+    const t = clean(el.getAttribute("title")).replace(/^(Descargar|Download)\s*/, "").replace(/^"(.*)"$/, "$1");
+    if (FILE_RE.test(t)) { m.name = t; break; }
+  }
+  // dimensiones reales (naturalWidth); una imagen bloqueada o sin cargar no da dimensiones
+  let area = -1;
+  for (const img of row.querySelectorAll("img")) {
+    const w = img.naturalWidth || 0, h = img.naturalHeight || 0;
+    if (w * h > area) {
+      area = w * h;
+      m.src = img.getAttribute("src") || "";
+      if (w && h) { m.width = w; m.height = h; }
+    }
+  }
+  const player = row.querySelector("audio[src], video[src]");
+  if (player) m.src = player.getAttribute("src");
+  for (const el of row.querySelectorAll("[data-icon]")) {
+    if (m.icons.length < 6) m.icons.push(el.getAttribute("data-icon"));
+  }
+  if (metaEls.length) m.caption = clean(metaEls[0].innerText);
+  return m;
+}
+
+function idOf(row) {
+  if (!row) return "";
+  const el = row.querySelector("[data-id]") || row.closest("[data-id]");
+  return el ? (el.getAttribute("data-id") || "") : "";
+}
+
+// Una fila = un mensaje. Las filas ya leídas en esta sesión quedan marcadas (data-wa-seen)
+// y se saltan antes de leer su texto o atributos. Devuelve true si la fila quedó resuelta.
+function harvestRow(row, id, out) {
+  if (session && row.getAttribute("data-wa-seen") === session) return true;
+
+  // 1) textos con meta
+  const metaEls = row.querySelectorAll("[data-pre-plain-text]");
+  metaEls.forEach((el, i) => {
+    out.push({
+      meta: clean(el.getAttribute("data-pre-plain-text")),
+      text: clean(el.innerText),
+      kind: "",
+      preview: "",
+      id: id && i ? id + "#" + i : id,
+    });
+  });
+
+  // 2) audios / adjuntos
+  const kind = kindOf(row);
+  if (kind) {
+    const rec = {
+      meta: metaEls.length ? clean(metaEls[0].getAttribute("data-pre-plain-text")) : "",
+      text: "[" + kind + "]",
+      kind: kind,
+      preview: clean(row.innerText).replace(/\n/g, " ").slice(0, 80),
+      id: id,
+    };
+    if (withMedia) rec.media = mediaOf(row, kind, metaEls);
+    out.push(rec);
+  }
+
+  // Solo se marca si ya dio algo: una burbuja que todavía está cargando se vuelve a mirar.
+  // Las que nunca dan nada (mensaje eliminado, llamada, aviso del sistema) se dan por resueltas
+  // después de MAX_ROW_TRIES pasos, para que no frenen la marca de agua el resto del chat.
+  let done = metaEls.length > 0 || !!kind;
+  if (!done) {
+    const tries = (parseInt(row.getAttribute("data-wa-tries"), 10) || 0) + 1;
+    row.setAttribute("data-wa-tries", String(tries));
+    done = tries >= MAX_ROW_TRIES;
+  }
+  if (done && session) row.setAttribute("data-wa-seen", session);
+  return done;
+}
+
+// Filas a visitar, de abajo hacia arriba. Con marca de agua: solo las que están por
+// encima de la fila más alta ya procesada (lo recién cargado por el scroll).
+let wmRow = null;
+if (watermark) {
+  const el = scroller.querySelector('[data-id="' + CSS.escape(watermark) + '"]');
+  wmRow = el && el.closest("div[role='row']");
+}
+const visit = [];
+if (wmRow) {
+  for (let r = wmRow.previousElementSibling; r; r = r.previousElementSibling) {
+    if (r.getAttribute("role") === "row") { visit.push(r); continue; }
+    const inner = r.querySelectorAll("div[role='row']");
+    for (let i = inner.length - 1; i >= 0; i--) visit.push(inner[i]);
+  }
+} else {
+  const all = scroller.querySelectorAll("div[role='row']");
+  for (let i = all.length - 1; i >= 0; i--) visit.push(all[i]);
+}
+
+// La marca sube mientras las filas (con data-id) estén resueltas; una burbuja a medio
+// cargar la frena para que el próximo paso la vuelva a mirar.
+let top = wmRow ? watermark : "";
+let blocked = false;
+const batches = [];
+for (const row of visit) {
+  const id = idOf(row);
+  const recs = [];
+  const done = harvestRow(row, id, recs);
+  batches.push(recs);
+  if (!id) continue;  // separadores de fecha, avisos del sistema...
+  if (!done) blocked = true;
+  else if (!blocked) top = id;
+}
+
+const records = [];
+for (let i = batches.length - 1; i >= 0; i--) records.push(...batches[i]);
+return {records: records, top: top, full: !wmRow, visited: visit.length};
+"""
+
+
+def harvest_visible_rows(driver, scroller, session="", watermark="", media=False):
+    """
+    Una sola ida y vuelta a chromedriver.
+    Devuelve {records: [{meta, text, kind, preview, id}], top, full, visited}:
+      - con `session`, las filas ya devueltas en esa sesión no se vuelven a leer
+      - con `watermark` (data-id), solo se visitan las filas por encima; `top` es la nueva marca
+      - full=True si no se encontró la marca y se recorrió todo
+      - con `media`, los audios / adjuntos traen además "media" (ver mediaOf / media_fields)
+    """
+    res = driver.execute_script(HARVEST_JS, scroller, session, watermark, media)
+    return res or {"records": [], "top": watermark, "full": True, "visited": 0}
+
+
+def harvest_visible_rows_py(driver, scroller):
+    """
+    Mismo resultado que harvest_visible_rows, pero con el recorrido original
+    (varios comandos WebDriver por elemento). Se deja para comparar / depurar.
+    """
+    records = []
+
+    # 1) TEXTOS “normales” (con meta)
+    for el in scroller.find_elements(By.XPATH, "//*[@data-pre-plain-text]"):
+        records.append({
+            "meta": (el.get_attribute("data-pre-plain-text") or "").strip(),
+            "text": (el.text or "").strip(),
+            "kind": "",
+            "preview": "",
+            "id": "",
+        })
+
+    # 2) AUDIOS / ADJUNTOS (aunque NO tengan data-pre-plain-text en el nodo que iteras)
+    for b in driver.find_elements(By.XPATH, "//div[@role='row']"):
+        kind = bubble_kind(b)
+        if not kind:
+            continue
+        records.append({
+            "meta": meta_from_bubble(b),  # puede venir "" si WhatsApp no lo expone
+            "text": f"[{kind}]",
+            "kind": kind,
+            "preview": (b.text or "").strip().replace("\n", " ")[:80],
+            "id": "",
+        })
+
+    return records
+
+
+@timed_phase("harvest")
+def harvest_rows(driver, scroller, mode=None, session="", state=None, media=False):
+    """
+    Lista de registros del scroller según HARVEST_MODE.
+    state: dict por chat donde se guarda la marca de agua entre pasos ("top")
+    y cuántas filas se visitaron / cuántos pasos fueron recorridos completos.
+    media: metadatos de adjuntos (--media); el modo "py" no los trae.
+    """
+    if (mode or HARVEST_MODE) == "py":
+        return harvest_visible_rows_py(driver, scroller)
+
+    watermark = state.get("top", "") if state is not None and INCREMENTAL_HARVEST else ""
+    res = harvest_visible_rows(driver, scroller, session, watermark, media)
+    if state is not None:
+        state["top"] = res.get("top") or ""
+        state["visited"] = state.get("visited", 0) + (res.get("visited") or 0)
+        state["full_passes"] = state.get("full_passes", 0) + (1 if res.get("full") else 0)
+    return res.get("records") or []
+
+
+# Trabajo duplicado del harvest: registros que vuelven a llegar ya vistos (acumulado de la corrida)
+HARVEST_STATS = {"passes": 0, "records": 0, "dupes": 0, "trimmed": 0}
+
+
+def message_identity(r):
+    """
+    Identidad del mensaje: el data-id de WhatsApp (+ tipo si es audio/adjunto).
+    Si la fila no trae data-id (modo "py"), la clave vieja meta||text.
+    """
+    if r.get("id"):
+        return f"{r['id']}:{r['kind']}" if r["kind"] else r["id"]
+    return message_key(r["meta"], r["text"], r["kind"], r["preview"])
+
+
+def msg_hash(identity):
+    # 64 bits estables entre corridas (hash() de Python cambia en cada proceso)
+    return int.from_bytes(hashlib.blake2b(identity.encode("utf-8"), digest_size=8).digest(), "big")
+
+
+def count_webdriver_commands(driver):
+    """
+    Envuelve driver.execute para contar los comandos enviados a chromedriver.
+    Devuelve un dict {"total": n, "<comando>": n, ...} que se va actualizando.
+    """
+    counts = driver.__dict__.get("_cmd_counts")
+    if counts is not None:
+        return counts
+
+    counts = {"total": 0}
+    original = driver.execute
+
+    def execute(command, params=None):
+        counts["total"] += 1
+        counts[command] = counts.get(command, 0) + 1
+        return original(command, params)
+
+    driver.execute = execute
+    driver._cmd_counts = counts
+    return counts
+
+
 #-----------------------------------------------------------------
 #............................................................>>>>>>>>> scrollea y recolect los mensajes dentro de un chat
 
-def scrape_messages_from_current_chat(driver, contact, time_limit_seconds=CHAT_TIME_LIMIT_SECONDS):
+def scrape_messages_from_current_chat(driver, contact, time_limit_seconds=CHAT_TIME_LIMIT_SECONDS, known_keys=None,
+                                      since=None, until=None, skip_keys=None, media=False):
     """
     Devuelve: (rows, timed_out)
-      - rows: lista de dicts {contact, meta, text}
-      - timed_out: True si excedió el tiempo límite (y el caller debe NO guardar este chat)
+      - rows: lista de dicts {contact, meta, text, msg_id, key}
+      - timed_out: True si se agotó el presupuesto; rows tiene lo leído hasta ahí (chat truncado)
+
+    known_keys: claves ya guardadas en el checkpoint (modo --resume).
+    Si aparece alguna, lo que queda más arriba ya está guardado y se deja de scrollear.
+    skip_keys: claves ya guardadas de un chat truncado: se saltan sin cortar, para seguir
+    más arriba de donde se llegó la vez anterior.
+    since / until: ventana de fechas; se deja de scrollear al cruzar `since`.
+    media: --media; las filas de audios / adjuntos traen las columnas MEDIA_HEADERS.
     """
     WebDriverWait(driver, 25).until(
         EC.presence_of_element_located((By.CSS_SELECTOR, "div.copyable-area"))
     )
     scroller = get_chat_scroller(driver)
 
-    messages = {}
+    messages = []
+    seen = {msg_hash(k) for k in skip_keys} if skip_keys else set()  # hashes de message_identity
+    known = {msg_hash(k) for k in known_keys} if known_keys else set()
+    # marca en el DOM de las filas ya leídas en esta pasada + marca de agua entre pasos
+    session = f"{time.time():.6f}" if INCREMENTAL_HARVEST else ""
+    harvest_state = {}
+    chat_stats = {"passes": 0, "records": 0, "dupes": 0, "trimmed": 0}
     idle = 0
     last_len = 0
 
@@ -355,40 +1825,75 @@ def scrape_messages_from_current_chat(driver, contact, time_limit_seconds=CHAT_T
     timed_out = False
 
     while True:
-        # ⏱️ TIMEOUT POR CHAT
-        if (time.time() - t0) > time_limit_seconds:
-            print(f"⏱️ Timeout {time_limit_seconds}s en chat '{contact}'. Se omite y NO se guarda.")
-            timed_out = True
-            break
-
-        # 1) TEXTOS “normales” (con meta)
-        elements = scroller.find_elements(By.XPATH, "//*[@data-pre-plain-text]")
-        for el in elements:
-            meta = (el.get_attribute("data-pre-plain-text") or "").strip()
-            text = (el.text or "").strip()
-
+        # 1-2) TEXTOS + AUDIOS / ADJUNTOS en un solo pase
+        reached_known = False
+        oldest_seen = None
+        records = harvest_rows(driver, scroller, session=session, state=harvest_state, media=media)
+        dates = parse_metas([r["meta"] for r in records])[1] if (since or until) else None
+        dupes = 0
+        identities = [message_identity(r) for r in records]
+        hashes = [msg_hash(x) for x in identities]
+        # Los registros vienen de arriba hacia abajo: todo lo que está por encima del último
+        # mensaje ya guardado también está guardado, aunque su clave no esté en `known`
+        # (con --sync solo se conocen las SYNC_TAIL_KEYS más nuevas)
+        cut = max((i for i, h in enumerate(hashes) if h in known), default=-1) if known else -1
+        for i, r in enumerate(records):
+            meta, text = r["meta"], r["text"]
             if not meta and not text:
                 continue
 
-            key = f"{meta}||{text}"
-            if key not in messages:
-                messages[key] = {"contact": contact, "meta": meta, "text": text}
+            identity, h = identities[i], hashes[i]
+            if h in seen:
+                dupes += 1
+                continue
+            seen.add(h)
 
-        # 2) AUDIOS / ADJUNTOS (sin meta directo)
-        bubbles = driver.find_elements(By.XPATH, "//div[@role='row']")
-        for b in bubbles:
-            kind = bubble_kind(b)
-            if not kind:
+            if i <= cut:
+                reached_known = True
                 continue
 
-            meta = meta_from_bubble(b)  # probablemente vacío si WA no expone el atributo
-            text = f"[{kind}]"
+            # Ventana --since / --until
+            if since or until:
+                d = dates[i]
+                if d is not None and (oldest_seen is None or d < oldest_seen):
+                    oldest_seen = d
+                if not in_date_window(d, since, until):
+                    continue
 
-            preview = (b.text or "").strip().replace("\n", " ")[:80]
-            key = f"{meta}||{text}||{preview}"
+            row = {
+                "contact": contact, "meta": meta, "text": text, "kind": r["kind"] or "TEXT",
+                "msg_id": r["id"], "key": identity,
+            }
+            if r.get("media"):
+                row.update(media_fields(r["media"], r["kind"]))
+            messages.append(row)
 
-            if key not in messages:
-                messages[key] = {"contact": contact, "meta": meta, "text": text}
+        # métrica: qué fracción de lo que llegó en este paso ya estaba visto
+        chat_stats["passes"] += 1
+        chat_stats["records"] += len(records)
+        chat_stats["dupes"] += dupes
+
+        # ⏱️ presupuesto agotado: lo leído se conserva (chat truncado)
+        if (time.time() - t0) > time_limit_seconds:
+            print(f"⏱️ Presupuesto de {time_limit_seconds:.0f}s agotado en '{contact}'. "
+                  f"Se guardan {len(messages)} mensajes (truncado).")
+            timed_out = True
+            break
+
+        # 2a) memoria: lo ya cosechado que quedó lejos debajo de la vista sale del DOM
+        if TRIM_DOM and session and chat_stats["passes"] % TRIM_EVERY_PASSES == 0:
+            with phase("trim"):
+                chat_stats["trimmed"] += trim_chat_dom(driver, scroller, session)
+
+        # 2b) delta: lo que queda más arriba ya está en el checkpoint
+        if reached_known:
+            print("🔁 Alcanzados mensajes ya guardados. Fin del delta.")
+            break
+
+        # 2c) lo que queda más arriba es todavía más viejo que --since
+        if since and oldest_seen and oldest_seen < since:
+            print(f"📅 Mensajes anteriores a {since}. Fin de la ventana.")
+            break
 
         # 3) corte por banner (E2E o Meta Admin)
         if end_to_end_banner_present(driver):
@@ -397,80 +1902,1124 @@ def scrape_messages_from_current_chat(driver, contact, time_limit_seconds=CHAT_T
 
         # 4) Click “mensajes anteriores del teléfono” si aparece
         if click_load_older_if_present(driver):
-            time.sleep(1.8)
+            pause(driver, None, 1.8)
             continue
 
         # 5) scroll un paso arriba
         scroll_chat_step(driver, scroller)
 
         # 6) watchdog (SIN input para no congelar)
-        if len(messages) == last_len:
+        if len(seen) == last_len:
             idle += 1
         else:
             idle = 0
-        last_len = len(messages)
+        last_len = len(seen)
 
         if idle >= 30:
             print("⚠️ No está avanzando (WhatsApp no carga más).")
             idle = 0
 
-    return list(messages.values()), timed_out
+    for k in chat_stats:
+        HARVEST_STATS[k] += chat_stats[k]
+    ratio = chat_stats["dupes"] / chat_stats["records"] if chat_stats["records"] else 0.0
+    print(f"♻️ Trabajo duplicado: {ratio:.0%} ({chat_stats['dupes']}/{chat_stats['records']} en {chat_stats['passes']} pasos)"
+          f" | filas visitadas: {harvest_state.get('visited', 0)}"
+          + (f" | filas podadas: {chat_stats['trimmed']}" if TRIM_DOM else ""))
+
+    return messages, timed_out
+
+
+# ======================================================
+# CHECKPOINT (SQLite): chats terminados + mensajes + meta más nuevo
+# ======================================================
+
+def message_key(meta, text, kind="", preview=""):
+    # Misma clave de dedupe que usa scrape_messages_from_current_chat
+    if kind:
+        return f"{meta}||{text}||{preview}"
+    return f"{meta}||{text}"
+
+
+def meta_sort_key(meta):
+    """
+    (fecha, hh, mm) del meta "[10:42, 12/3/2025] Juan: " para comparar qué mensaje es más nuevo.
+    """
+    (ts,), (d,), _ = parse_metas((meta,))
+    if d is None:
+        return None
+    return (d, ts.hour, ts.minute) if ts else (d, 0, 0)
+
+
+def checkpoint_open(path):
+    conn = sqlite3.connect(path)
+    # WAL: el escritor del pipeline escribe mientras el hilo del navegador lee
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.executescript("""
+        CREATE TABLE IF NOT EXISTS runs (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            started_at TEXT NOT NULL,
+            finished_at TEXT
+        );
+        CREATE TABLE IF NOT EXISTS chats (
+            title TEXT PRIMARY KEY,
+            run_id INTEGER,
+            completed_at TEXT,
+            newest_meta TEXT,
+            messages INTEGER,
+            truncated INTEGER DEFAULT 0,
+            reached_meta TEXT,
+            preview TEXT,
+            activity TEXT,
+            tail_keys TEXT
+        );
+        CREATE TABLE IF NOT EXISTS messages (
+            title TEXT NOT NULL,
+            key TEXT NOT NULL,
+            meta TEXT,
+            text TEXT,
+            run_id INTEGER,
+            msg_id TEXT,
+            kind TEXT,
+            media TEXT,
+            PRIMARY KEY (title, key)
+        );
+    """)
+    # checkpoints viejos: columnas agregadas después
+    for table, added in (
+        ("chats", (("truncated", "INTEGER DEFAULT 0"), ("reached_meta", "TEXT"), ("preview", "TEXT"),
+                   ("activity", "TEXT"), ("tail_keys", "TEXT"))),
+        ("messages", (("msg_id", "TEXT"), ("kind", "TEXT"), ("media", "TEXT"))),
+    ):
+        cols = {row[1] for row in conn.execute(f"PRAGMA table_info({table})")}
+        for col, ddl in added:
+            if col not in cols:
+                conn.execute(f"ALTER TABLE {table} ADD COLUMN {col} {ddl}")
+    return conn
+
+
+def checkpoint_start_run(conn, resume=False):
+    """
+    Con resume=True reutiliza la última corrida que no terminó (crash, Chrome caído...).
+    Si no hay ninguna pendiente, abre una nueva.
+    """
+    if resume:
+        row = conn.execute(
+            "SELECT id FROM runs WHERE finished_at IS NULL ORDER BY id DESC LIMIT 1"
+        ).fetchone()
+        if row:
+            return row[0]
+
+    cur = conn.execute(
+        "INSERT INTO runs (started_at) VALUES (?)",
+        (datetime.now().isoformat(timespec="seconds"),)
+    )
+    conn.commit()
+    return cur.lastrowid
+
+
+def checkpoint_finish_run(conn, run_id):
+    conn.execute(
+        "UPDATE runs SET finished_at = ? WHERE id = ?",
+        (datetime.now().isoformat(timespec="seconds"), run_id)
+    )
+    conn.commit()
+
+
+def checkpoint_completed_titles(conn, run_id):
+    return {t for (t,) in conn.execute(
+        "SELECT title FROM chats WHERE run_id = ? AND completed_at IS NOT NULL", (run_id,)
+    )}
+
+
+def checkpoint_known_keys(conn, title):
+    return {k for (k,) in conn.execute("SELECT key FROM messages WHERE title = ?", (title,))}
+
+
+def msg_id_from_key(key):
+    # checkpoints viejos sin msg_id: la clave es el data-id (+ ":AUDIO"/":ADJUNTO"); meta||text no tiene
+    if not key or "||" in key:
+        return None
+    return re.sub(r":(AUDIO|ADJUNTO)$", "", key)
+
+
+def checkpoint_run_rows(conn, run_id):
+    """Las filas de la corrida tal como salieron (msg_id, tipo y columnas de --media incluidos)."""
+    rows = []
+    for (t, k, m, x, msg_id, kind, media) in conn.execute(
+        "SELECT title, key, meta, text, msg_id, kind, media FROM messages WHERE run_id = ? ORDER BY rowid",
+        (run_id,),
+    ):
+        row = {"contact": t, "meta": m, "text": x, "key": k, "msg_id": msg_id or msg_id_from_key(k), "kind": kind}
+        if media:
+            row.update(json.loads(media))
+        rows.append(row)
+    return rows
+
+
+# --sync: cuántas claves de los mensajes más nuevos se guardan por chat (la huella del chat);
+# alcanza con que aparezca una para saber que lo de arriba ya está guardado
+SYNC_TAIL_KEYS = 20
+
+
+def checkpoint_chat_states(conn):
+    """
+    {título: {preview, activity, truncated, completed, tail_keys}} para --sync: con qué fila
+    del panel se guardó cada chat y la huella (claves de sus mensajes más nuevos).
+    """
+    return {
+        title: {
+            "preview": preview, "activity": activity, "truncated": bool(truncated),
+            "completed": completed is not None, "tail_keys": {k for _, k in json.loads(tail or "[]")},
+        }
+        for (title, preview, activity, truncated, completed, tail) in conn.execute(
+            "SELECT title, preview, activity, truncated, completed_at, tail_keys FROM chats"
+        )
+    }
+
+
+def checkpoint_newest_metas(conn):
+    """{título: meta del mensaje más nuevo guardado} (para --order changed)."""
+    return dict(conn.execute("SELECT title, newest_meta FROM chats"))
+
+
+def checkpoint_truncated_chats(conn):
+    """{título: meta más viejo alcanzado} de los chats que quedaron a medias (presupuesto agotado)."""
+    return dict(conn.execute("SELECT title, reached_meta FROM chats WHERE truncated = 1"))
+
+
+NO_SORT_KEY = (datetime.min.date(), 0, 0)
+
+
+def chat_summary(rows):
+    """
+    (newest_meta, oldest_meta, tail) de las filas de un chat con un solo parse_metas en bloque;
+    tail = [meta, clave] de los SYNC_TAIL_KEYS mensajes más nuevos. Es la parte de
+    checkpoint_save_chat que no toca SQLite.
+    """
+    timestamps, dates, _ = parse_metas([r["meta"] for r in rows])
+    items = []
+    for r, ts, d in zip(rows, timestamps, dates):
+        k = None if d is None else ((d, ts.hour, ts.minute) if ts else (d, 0, 0))
+        items.append((k, r["meta"], r["key"]))
+    dated = [it for it in items if it[0] is not None]
+    newest = max(dated, key=lambda it: it[0])[1] if dated else None
+    oldest = min(dated, key=lambda it: it[0])[1] if dated else None
+    tail = [[m, key] for _, m, key in heapq.nlargest(SYNC_TAIL_KEYS, items, key=lambda it: it[0] or NO_SORT_KEY)]
+    return newest, oldest, tail
+
+
+def media_json(row):
+    """Columnas de --media de la fila que tienen valor, como JSON (None si no hay ninguna)."""
+    media = {col: row[col] for col in MEDIA_HEADERS if row.get(col) is not None}
+    return json.dumps(media, ensure_ascii=False) if media else None
+
+
+def checkpoint_save_chat(conn, run_id, title, rows, truncated=False, listing=None):
+    """
+    Guarda los mensajes del chat y lo marca como terminado, todo en una transacción.
+    truncated=True: se guardan igual, pero el chat queda sin terminar (completed_at NULL) y con
+    reached_meta = hasta dónde se llegó, para seguir desde ahí más tarde.
+    listing: la fila del panel (get_visible_chats) con la que se abrió, para --sync.
+    """
+    prev = conn.execute(
+        "SELECT newest_meta, reached_meta, preview, activity, tail_keys FROM chats WHERE title = ?", (title,)
+    ).fetchone()
+    newest, oldest, tail = chat_summary(rows)
+    if prev:
+        # se combina con lo guardado antes (ante empate gana lo anterior)
+        newest = max((m for m in (prev[0], newest) if meta_sort_key(m)), key=meta_sort_key, default=None)
+        oldest = min((m for m in (prev[1], oldest) if meta_sort_key(m)), key=meta_sort_key, default=None)
+        # huella: [meta, clave] de los SYNC_TAIL_KEYS mensajes más nuevos (los guardados antes + estos)
+        tail = sorted(json.loads(prev[4] or "[]") + tail, key=lambda mk: meta_sort_key(mk[0]) or NO_SORT_KEY,
+                      reverse=True)[:SYNC_TAIL_KEYS]
+
+    if listing:
+        preview, activity = listing.get("preview"), activity_stamp(listing.get("activity"))
+    else:
+        preview, activity = (prev[2], prev[3]) if prev else (None, None)
+
+    with conn:
+        conn.executemany(
+            "INSERT INTO messages (title, key, meta, text, run_id, msg_id, kind, media) "
+            "VALUES (?, ?, ?, ?, ?, ?, ?, ?) "
+            "ON CONFLICT(title, key) DO UPDATE SET run_id = excluded.run_id, "
+            "msg_id = COALESCE(excluded.msg_id, msg_id), kind = COALESCE(excluded.kind, kind), "
+            "media = COALESCE(excluded.media, media)",
+            [(title, r["key"], r["meta"], r["text"], run_id, r.get("msg_id") or None, r.get("kind"),
+              media_json(r)) for r in rows]
+        )
+        conn.execute(
+            "INSERT INTO chats (title, run_id, completed_at, newest_meta, messages, truncated, reached_meta, "
+            "preview, activity, tail_keys) "
+            "VALUES (?, ?, ?, ?, (SELECT COUNT(*) FROM messages WHERE title = ?), ?, ?, ?, ?, ?) "
+            "ON CONFLICT(title) DO UPDATE SET run_id = excluded.run_id, completed_at = excluded.completed_at, "
+            "newest_meta = excluded.newest_meta, messages = excluded.messages, "
+            "truncated = excluded.truncated, reached_meta = excluded.reached_meta, "
+            "preview = excluded.preview, activity = excluded.activity, tail_keys = excluded.tail_keys",
+            (
+                title, run_id, None if truncated else datetime.now().isoformat(timespec="seconds"),
+                newest, title, int(truncated), oldest, preview, activity, json.dumps(tail, ensure_ascii=False),
+            )
+        )
+
+
+# ======================================================
+# 5b) MEDIA (metadatos en el mismo pase + descargas opcionales)
+# ======================================================
+
+# --media: los audios / adjuntos traen lo que la burbuja ya muestra (duración, nombre, tamaño,
+# tipo, dimensiones, pie de foto) en el mismo execute_script del harvest. Sin clicks ni descargas.
+MEDIA_HEADERS = [
+    "media_name", "media_size", "media_mime", "media_duration_s",
+    "media_width", "media_height", "media_caption", "media_sha256",
+]
+
+SIZE_UNITS = {"b": 1, "bytes": 1, "kb": 1024, "mb": 1024 ** 2, "gb": 1024 ** 3}
+MEDIA_SIZE_RE = re.compile(r"(\d+(?:[.,]\d+)?)\s?(bytes|b|kb|mb|gb)\b", re.I)
+# data-icon de la burbuja -> tipo, cuando no hay nombre de archivo del que sacarlo
+MEDIA_ICON_MIME = {
+    "ptt-play": "audio/ogg",
+    "audio-play": "audio/mpeg",
+    "media-play": "video/mp4",
+    "media-gif": "image/gif",
+}
+
+
+def media_size_bytes(label):
+    """'245 kB' / '1,5 MB' -> bytes (None si no hay tamaño)."""
+    m = MEDIA_SIZE_RE.search(label or "")
+    if not m:
+        return None
+    return int(float(m.group(1).replace(",", ".")) * SIZE_UNITS[m.group(2).lower()])
+
+
+def media_duration_s(label):
+    """'1:23' / '1:02:03' -> segundos."""
+    if not label:
+        return None
+    secs = 0
+    for part in label.split(":"):
+        if not part.isdigit():
+            return None
+        secs = secs * 60 + int(part)
+    return secs
+
+
+def media_mime_hint(kind, name=None, src="", icons=(), has_image=False):
+    """Tipo probable: extensión del nombre > data: URI > ícono de la burbuja > genérico por tipo."""
+    if name:
+        mime = mimetypes.guess_type(name)[0]
+        if mime:
+            return mime
+    if src.startswith("data:"):
+        return src[5:].split(";", 1)[0].split(",", 1)[0] or None
+    for icon in icons or ():
+        if icon in MEDIA_ICON_MIME:
+            return MEDIA_ICON_MIME[icon]
+    if has_image:
+        return "image/*"
+    return "audio/*" if kind == "AUDIO" else None
+
+
+def media_fields(raw, kind):
+    """Registro "media" de HARVEST_JS -> columnas MEDIA_HEADERS (None si no se ve) + media_src."""
+    width, height = raw.get("width") or None, raw.get("height") or None
+    src = raw.get("src") or ""
+    return {
+        "media_name": raw.get("name") or None,
+        "media_size": media_size_bytes(raw.get("size")),
+        "media_mime": media_mime_hint(kind, raw.get("name"), src, raw.get("icons"), bool(width)),
+        "media_duration_s": media_duration_s(raw.get("duration")),
+        "media_width": width,
+        "media_height": height,
+        "media_caption": raw.get("caption") or None,
+        "media_sha256": None,
+        "media_src": src,  # no va a la salida: lo usa MediaDownloader
+    }
+
+
+# --download-media DIR: cola opt-in que baja los blobs a un almacén por contenido
+MEDIA_DOWNLOADS_PER_MINUTE = 20
+MEDIA_DOWNLOADS_PER_CHAT = 10
+MEDIA_MAX_BYTES = 25 * 1024 * 1024
+
+# acumulado de la corrida
+MEDIA_STATS = {"queued": 0, "fetched": 0, "deduped": 0, "skipped": 0, "failed": 0, "bytes": 0}
+
+FETCH_MEDIA_JS = r"""
+const src = arguments[0], maxBytes = arguments[1], done = arguments[arguments.length - 1];
+fetch(src).then((r) => r.blob()).then((b) => {
+  if (b.size > maxBytes) return done({error: "pesa " + b.size + " bytes"});
+  const reader = new FileReader();
+  reader.onload = () => done({data: String(reader.result).split(",")[1] || "", type: b.type, size: b.size});
+  reader.onerror = () => done({error: "no se pudo leer el blob"});
+  reader.readAsDataURL(b);
+}).catch((e) => done({error: String(e)}));
+"""
+
+
+class MediaDownloader:
+    """
+    Descargas opcionales (--download-media), en dos mitades:
+    - fetch_chat (hilo del navegador, con el chat abierto): trae los bytes de lo que el navegador
+      ya tiene (src blob: / data: de la burbuja, sin clicks); las URLs blob: no sobreviven al
+      cambio de chat. No duerme: un balde de per_minute descargas por minuto (y como mucho
+      per_chat por chat) decide cuántas entran; el resto cuenta como "skipped" y se vuelve a
+      intentar la próxima vez que se abra el chat.
+    - store_chat (escritor de ChatPipeline): sha256, almacén por contenido
+      <root>/<sha256[:2]>/<sha256><ext> (el mismo archivo en dos chats se guarda una vez) y
+      <root>/manifest.jsonl, una línea por mensaje descargado (chat, msg_id, key, sha256, path,
+      mime, bytes). Lo que ya figura ahí no se vuelve a pedir en corridas siguientes.
+    """
+
+    def __init__(self, root, per_minute=MEDIA_DOWNLOADS_PER_MINUTE, per_chat=MEDIA_DOWNLOADS_PER_CHAT,
+                 max_bytes=MEDIA_MAX_BYTES):
+        self.root = root
+        self.per_chat = per_chat
+        self.max_bytes = max_bytes
+        self.per_minute = per_minute
+        self.manifest_path = os.path.join(root, "manifest.jsonl")
+        self.done = {}  # (chat, key) -> sha256 de lo ya descargado
+        self._lock = threading.Lock()  # done lo lee el navegador y lo escribe el escritor del pipeline
+        self._tokens = float(per_chat)
+        self._t_tokens = time.monotonic()
+        os.makedirs(root, exist_ok=True)
+        if os.path.exists(self.manifest_path):
+            with open(self.manifest_path, encoding="utf-8") as f:
+                for line in f:
+                    if line.strip():
+                        entry = json.loads(line)
+                        self.done[(entry["chat"], entry["key"])] = entry["sha256"]
+
+    def _take_token(self):
+        # balde de per_chat fichas que se rellena a per_minute por minuto; sin fichas no se espera
+        if self.per_minute <= 0:
+            return True
+        now = time.monotonic()
+        self._tokens = min(self.per_chat, self._tokens + (now - self._t_tokens) * self.per_minute / 60.0)
+        self._t_tokens = now
+        if self._tokens < 1:
+            return False
+        self._tokens -= 1
+        return True
+
+    def store(self, blob, ext):
+        """Guarda el blob por contenido; devuelve (sha256, ruta, ya_estaba)."""
+        sha = hashlib.sha256(blob).hexdigest()
+        path = os.path.join(self.root, sha[:2], sha + ext)
+        if os.path.exists(path):
+            return sha, path, True
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp = f"{path}.{os.getpid()}.tmp"
+        with open(tmp, "wb") as f:
+            f.write(blob)
+        os.replace(tmp, path)  # atómico: otro perfil escribiendo el mismo sha no deja un archivo a medias
+        return sha, path, False
+
+    def fetch_chat(self, driver, title, rows):
+        """
+        Trae los bytes de los adjuntos de `rows` (el chat abierto) a r["media_blob"]; los ya
+        descargados en otra corrida reciben su media_sha256 directamente.
+        """
+        pending = []
+        with self._lock:
+            for r in rows:
+                if not (r.get("media_src") or "").startswith(("blob:", "data:")):
+                    continue
+                if (title, r["key"]) in self.done:
+                    r["media_sha256"] = self.done[(title, r["key"])]
+                else:
+                    pending.append(r)
+        MEDIA_STATS["queued"] += len(pending)
+
+        fetched = 0
+        for k, r in enumerate(pending):
+            if k >= self.per_chat or not self._take_token():
+                MEDIA_STATS["skipped"] += len(pending) - k
+                break
+            try:
+                res = driver.execute_async_script(FETCH_MEDIA_JS, r["media_src"], self.max_bytes) or {}
+            except Exception as e:
+                res = {"error": e.__class__.__name__}
+            if not res.get("data"):
+                MEDIA_STATS["failed"] += 1
+                print(f"⚠️ Adjunto no descargado ({r.get('media_name') or r['kind']}): {res.get('error')}")
+                continue
+            r["media_blob"] = (res["data"], res.get("type") or "")
+            fetched += 1
+        return fetched
+
+    def store_chat(self, title, rows):
+        """Guarda los blobs traídos por fetch_chat y completa media_sha256 (lo llama ChatPipeline)."""
+        entries = []
+        for r in rows:
+            if "media_blob" not in r:
+                continue
+            data, mime = r.pop("media_blob")
+            blob = base64.b64decode(data)
+            mime = mime or r.get("media_mime") or ""
+            ext = os.path.splitext(r.get("media_name") or "")[1] or mimetypes.guess_extension(mime) or ".bin"
+            sha, path, existed = self.store(blob, ext)
+            MEDIA_STATS["deduped" if existed else "fetched"] += 1
+            MEDIA_STATS["bytes"] += 0 if existed else len(blob)
+            r["media_sha256"] = sha
+            entries.append({
+                "chat": title, "msg_id": r.get("msg_id"), "key": r["key"], "sha256": sha,
+                "path": os.path.relpath(path, self.root), "mime": mime, "bytes": len(blob),
+            })
+        if not entries:
+            return 0
+        with open(self.manifest_path, "a", encoding="utf-8") as manifest:
+            for e in entries:
+                manifest.write(json.dumps(e, ensure_ascii=False) + "\n")
+        with self._lock:
+            self.done.update(((title, e["key"]), e["sha256"]) for e in entries)
+        return len(entries)
 
 
 # ======================================================
 # 6) CSV
 # ======================================================
 
+CSV_HEADERS = ["contact", "meta", "text", "msg_id"]
+
+
 def save_to_csv(filename, rows):
-    headers = ["contact", "meta", "text"]
+    headers = CSV_HEADERS
     with open(filename, "w", newline="", encoding="utf-8-sig") as f:
-        writer = csv.DictWriter(f, fieldnames=headers)
+        writer = csv.DictWriter(f, fieldnames=headers, extrasaction="ignore")
         writer.writeheader()
         writer.writerows(rows)
 
 
+class CsvStreamWriter:
+    """
+    Escribe el CSV a medida que termina cada chat (en vez de juntar todas las filas en memoria).
+    - El archivo se abre una sola vez (al llegar la primera fila).
+    - Buffer acotado: como mucho max_buffer filas en memoria antes de escribir.
+    - fsync cada fsync_every segundos: si el proceso muere, el CSV en disco sigue siendo válido.
+    Con append=True continúa un CSV existente (--resume) sin repetir cabecera ni BOM y con
+    las columnas que ya tenga (p. ej. sin las de --media).
+    """
+
+    def __init__(self, filename, append=False, max_buffer=2000, fsync_every=15.0, fieldnames=None):
+        self.filename = filename
+        self.fieldnames = fieldnames or CSV_HEADERS
+        self.append = append and os.path.exists(filename) and os.path.getsize(filename) > 0
+        self.max_buffer = max_buffer
+        self.fsync_every = fsync_every
+        self.rows_written = 0
+        self._buffer = []
+        self._f = None
+        self._writer = None
+        self._last_fsync = time.time()
+
+    def _open(self):
+        if self.append:
+            with open(self.filename, newline="", encoding="utf-8-sig") as f:
+                header = next(csv.reader(f), None)
+            self._f = open(self.filename, "a", newline="", encoding="utf-8")
+            self._writer = csv.DictWriter(self._f, fieldnames=header or self.fieldnames, extrasaction="ignore")
+        else:
+            self._f = open(self.filename, "w", newline="", encoding="utf-8-sig")
+            self._writer = csv.DictWriter(self._f, fieldnames=self.fieldnames, extrasaction="ignore")
+            self._writer.writeheader()
+
+    def write_rows(self, rows):
+        for r in rows:
+            self._buffer.append(r)
+            if len(self._buffer) >= self.max_buffer:
+                self.flush()
+
+    def flush(self, fsync=False):
+        if self._buffer:
+            if self._f is None:
+                self._open()
+            self._writer.writerows(self._buffer)
+            self.rows_written += len(self._buffer)
+            self._buffer.clear()
+
+        if self._f is None:
+            return
+        self._f.flush()
+        if fsync or (time.time() - self._last_fsync) >= self.fsync_every:
+            os.fsync(self._f.fileno())
+            self._last_fsync = time.time()
+
+    def close(self):
+        self.flush(fsync=True)
+        if self._f is not None:
+            self._f.close()
+            self._f = None
+
+
+
+# ======================================================
+# 6b) PARQUET / ARROW (columnas tipadas)
+# ======================================================
+
+def kind_of_row(r):
+    if r.get("kind"):
+        return r["kind"]
+    text = r.get("text") or ""
+    return text[1:-1] if text in ("[AUDIO]", "[ADJUNTO]") else "TEXT"
+
+
+def arrow_schema(media=False):
+    fields = [
+        ("contact", pa.string()),
+        ("timestamp", pa.timestamp("s")),
+        ("sender", pa.string()),
+        ("kind", pa.string()),
+        ("text", pa.string()),
+        ("msg_id", pa.string()),
+    ]
+    if media:
+        fields += [
+            ("media_name", pa.string()),
+            ("media_size", pa.int64()),
+            ("media_mime", pa.string()),
+            ("media_duration_s", pa.int32()),
+            ("media_width", pa.int32()),
+            ("media_height", pa.int32()),
+            ("media_caption", pa.string()),
+            ("media_sha256", pa.string()),
+        ]
+    return pa.schema(fields)
+
+
+class ArrowStreamWriter:
+    """
+    Salida Parquet (fmt="parquet") o Arrow IPC (fmt="arrow") con columnas tipadas:
+    contact, timestamp, sender, kind (TEXT/AUDIO/ADJUNTO), text, msg_id (+ MEDIA_HEADERS con --media).
+    - El meta se parsea una sola vez, en bloque, al escribir cada row group (parse_metas).
+    - Cada row group se escribe apenas junta row_group_size filas: memoria acotada.
+    - El archivo queda válido al cerrar (Parquet/Arrow escriben el índice al final) y no admite
+      append: con --resume se rehace desde el checkpoint.
+    """
+
+    def __init__(self, filename, fmt="parquet", row_group_size=50_000, media=False):
+        if pa is None:
+            raise RuntimeError("--format parquet/arrow necesita pyarrow (pip install pyarrow)")
+        self.filename = filename
+        self.fmt = fmt
+        self.row_group_size = row_group_size
+        self.append = False
+        self.rows_written = 0
+        self._buffer = []
+        self._writer = None
+        self.media = media
+        self._schema = arrow_schema(media)
+
+    def write_rows(self, rows):
+        for r in rows:
+            self._buffer.append(r)
+            if len(self._buffer) >= self.row_group_size:
+                self._write_group()
+
+    def flush(self, fsync=False):
+        # Row groups chicos (uno por chat) inflan el archivo: solo se escriben llenos
+        if len(self._buffer) >= self.row_group_size:
+            self._write_group()
+
+    def _write_group(self):
+        rows, self._buffer = self._buffer, []
+        timestamps, _, senders = parse_metas([r.get("meta") or "" for r in rows])
+        columns = {
+            "contact": [r.get("contact") for r in rows],
+            "timestamp": timestamps,
+            "sender": senders,
+            "kind": [kind_of_row(r) for r in rows],
+            "text": [r.get("text") for r in rows],
+            "msg_id": [r.get("msg_id") or None for r in rows],
+        }
+        if self.media:
+            for col in MEDIA_HEADERS:
+                columns[col] = [r.get(col) for r in rows]
+        table = pa.table(columns, schema=self._schema)
+
+        if self._writer is None:
+            if self.fmt == "arrow":
+                self._writer = pa_ipc.new_file(self.filename, self._schema)
+            else:
+                self._writer = pq.ParquetWriter(self.filename, self._schema, compression="zstd")
+
+        if self.fmt == "arrow":
+            self._writer.write_table(table, max_chunksize=self.row_group_size)
+        else:
+            self._writer.write_table(table, row_group_size=self.row_group_size)
+        self.rows_written += len(rows)
+
+    def close(self):
+        if self._buffer:
+            self._write_group()
+        if self._writer is not None:
+            self._writer.close()
+            self._writer = None
+
+
+OUTPUT_FORMATS = {"csv": ".csv", "parquet": ".parquet", "arrow": ".arrow"}
+
+
+def open_row_sink(output_path, fmt="csv", append=False, media=False):
+    if fmt == "csv":
+        return CsvStreamWriter(output_path, append=append, fieldnames=CSV_HEADERS + MEDIA_HEADERS if media else None)
+    return ArrowStreamWriter(output_path, fmt=fmt, media=media)
+
+
+# ======================================================
+# 6c) PRESUPUESTO DE TIEMPO POR CHAT
+# ======================================================
+
+# pasadas extra sobre los chats truncados, cada una con más presupuesto
+MAX_BUDGET_RETRIES = 2
+
+
+class ChatBudget:
+    """
+    Segundos por chat en vez de un límite fijo que tira el trabajo:
+    - primera pasada: CHAT_TIME_LIMIT_SECONDS, o lo que tarda un chat promedio al ritmo de carga
+      observado (con `headroom` de margen) si es más; achicado si con --deadline no alcanza para
+      los chats que faltan (se reserva una parte para los reintentos);
+    - reintento de un chat truncado: `growth` veces el presupuesto anterior más lo que cuesta
+      volver a bajar hasta donde se llegó (filas ya guardadas / ritmo de carga observado),
+      repartiendo lo que queda de corrida entre los reintentos pendientes.
+    """
+
+    def __init__(self, base=CHAT_TIME_LIMIT_SECONDS, deadline_seconds=None, min_budget=10, max_budget=600,
+                 growth=3, retry_share=0.3, headroom=1.5):
+        self.base = base
+        self.deadline = time.time() + deadline_seconds if deadline_seconds else None
+        self.min_budget = min_budget
+        self.max_budget = max_budget
+        self.growth = growth
+        self.retry_share = retry_share
+        self.headroom = headroom
+        self.rate = None  # mensajes/segundo (media móvil)
+        self.scrapes = 0
+        self.rows_seen = 0
+
+    def observe(self, rows, seconds):
+        self.scrapes += 1
+        self.rows_seen += rows
+        if seconds <= 0 or rows <= 0:
+            return
+        r = rows / seconds
+        self.rate = r if self.rate is None else 0.8 * self.rate + 0.2 * r
+
+    def remaining(self):
+        return self.deadline - time.time() if self.deadline else float("inf")
+
+    def expired(self):
+        return self.remaining() < self.min_budget
+
+    def first_pass(self, chats_left):
+        budget = self.base
+        if self.rate and self.scrapes:
+            budget = max(budget, self.headroom * (self.rows_seen / self.scrapes) / self.rate)
+        if self.deadline:
+            budget = min(budget, (1 - self.retry_share) * self.remaining() / max(1, chats_left))
+        return max(self.min_budget, min(self.max_budget, budget))
+
+    def retry(self, prev_budget, rows_saved, retries_left):
+        catch_up = rows_saved / self.rate if self.rate else prev_budget
+        budget = catch_up + self.growth * prev_budget
+        if self.deadline:
+            budget = min(budget, self.remaining() / max(1, retries_left))
+        return max(self.min_budget, min(self.max_budget, budget))
+
+
+# ======================================================
+# 6d) PIPELINE (el navegador no espera a la escritura)
+# ======================================================
+
+# False (--no-pipeline): checkpoint y salida se escriben en el hilo del navegador, como antes
+PIPELINE_BACKGROUND = True
+# chats scrapeados esperando escritura; con la cola llena el navegador espera (back-pressure)
+PIPELINE_MAX_PENDING = 8
+
+
+class PipelineError(RuntimeError):
+    """El escritor falló (disco lleno, sink roto...): lo que se siga scrapeando no se guardaría."""
+
+
+class ChatPipeline:
+    """
+    La escritura de cada chat sale del hilo que maneja el navegador:
+
+        navegador --submit()--> cola acotada --> escritor (salida + checkpoint)
+
+    - La cola tiene max_pending chats: si la escritura se atrasa, submit() bloquea (back-pressure)
+      en vez de juntar memoria sin límite.
+    - Un solo hilo escritor, con su propia conexión SQLite: ni SQLite ni el sink se comparten
+      entre hilos, y se escribe en el orden en que se scrapeó.
+    - media: MediaDownloader de --download-media; el escritor guarda los blobs que trajo
+      fetch_chat (store_chat) antes de escribir las filas con su media_sha256.
+    - background=False: todo en línea dentro de submit().
+    Un error del escritor se relanza como PipelineError en el próximo submit() / drain() / close():
+    la corrida se corta ahí, no se sigue con el chat siguiente.
+    """
+
+    def __init__(self, checkpoint_path, run_id, sink, background=PIPELINE_BACKGROUND,
+                 max_pending=PIPELINE_MAX_PENDING, media=None):
+        self.checkpoint_path = checkpoint_path
+        self.media = media
+        self.run_id = run_id
+        self.sink = sink
+        self.background = background
+        self.stats = {"chats": 0, "rows": 0, "max_depth": 0, "producer_wait_s": 0.0, "write_s": 0.0, "latency_s": 0.0}
+        self._error = None
+        if not background:
+            self._conn = checkpoint_open(checkpoint_path)
+            return
+        self._jobs = queue.Queue(maxsize=max_pending)
+        self._thread = threading.Thread(target=self._write_loop, name="pipeline-write", daemon=True)
+        self._thread.start()
+
+    def _raise_pending(self):
+        if self._error is not None:
+            raise PipelineError(f"pipeline: {self._error}") from self._error
+
+    def submit(self, title, rows, truncated=False, listing=None):
+        self._raise_pending()
+        job = {"title": title, "rows": rows, "truncated": truncated, "listing": listing, "t": time.perf_counter()}
+        self.stats["chats"] += 1
+        self.stats["rows"] += len(rows)
+        if not self.background:
+            try:
+                self._write(self._conn, job)
+            except Exception as e:
+                self._error = e
+                self._raise_pending()
+            return
+        t0 = time.perf_counter()
+        self._jobs.put(job)  # bloquea si hay max_pending chats sin escribir
+        self.stats["producer_wait_s"] += time.perf_counter() - t0
+        self.stats["max_depth"] = max(self.stats["max_depth"], self._jobs.qsize())
+
+    def _write(self, conn, job):
+        t0 = time.perf_counter()
+        if self.media:
+            self.media.store_chat(job["title"], job["rows"])
+        # primero la salida y después el checkpoint: si se corta en el medio, --resume vuelve a bajar
+        # el chat (a lo sumo filas repetidas) en vez de darlo por terminado sin sus filas
+        self.sink.write_rows(job["rows"])
+        self.sink.flush()
+        checkpoint_save_chat(conn, self.run_id, job["title"], job["rows"], truncated=job["truncated"],
+                             listing=job["listing"])
+        now = time.perf_counter()
+        self.stats["write_s"] += now - t0
+        self.stats["latency_s"] += now - job["t"]
+
+    def _write_loop(self):
+        conn = checkpoint_open(self.checkpoint_path)
+        try:
+            while True:
+                job = self._jobs.get()
+                try:
+                    if job is None:
+                        return  # close()
+                    if self._error is None:
+                        self._write(conn, job)
+                except Exception as e:
+                    self._error = e
+                finally:
+                    self._jobs.task_done()
+        finally:
+            conn.close()
+
+    def drain(self):
+        """Espera a que todo lo encolado esté escrito (p. ej. antes de leer el checkpoint)."""
+        if self.background:
+            self._jobs.join()
+        self._raise_pending()
+
+    def close(self):
+        if self.background:
+            self._jobs.put(None)
+            self._thread.join()
+        else:
+            self._conn.close()
+        self._raise_pending()
+
+    def metrics(self):
+        st = dict(self.stats)
+        for k in ("producer_wait_s", "write_s"):
+            st[k] = round(st[k], 3)
+        st["latency_s"] = round(st["latency_s"] / st["chats"], 3) if st["chats"] else 0.0
+        return st
+
+
 # ======================================================
 # 7) MAIN
 # ======================================================
-def main():
-    profile = input("Perfil (wpp1..wpp6): ").strip().lower()
-    if profile not in {"wpp1","wpp2","wpp3","wpp4","wpp5","wpp6"}:
-        profile = "wpp1"
-    print("✅ Usando perfil:", profile)
+PROFILES = ["wpp1", "wpp2", "wpp3", "wpp4", "wpp5", "wpp6"]
 
-    driver = setup_driver(profile)
-    driver.get("https://web.whatsapp.com/")
-    wait_for_whatsapp_login(driver)
 
-    output_name = input("Nombre del archivo CSV (sin .csv): ").strip()
-    safe_name = "".join(c for c in output_name if c.isalnum() or c in (" ", "_", "-")).strip().replace(" ", "-")
+def load_config_defaults(parser, argv=None):
+    """
+    --config archivo.json: valores por defecto para cualquier flag (claves = nombre del flag
+    con guiones bajos, ej. {"headless": true, "output": "diario", "since": "7d", "format": "parquet"}).
+    Lo que venga por línea de comandos sigue ganando.
+    """
+    pre = argparse.ArgumentParser(add_help=False)
+    pre.add_argument("--config", default=None)
+    known, _ = pre.parse_known_args(argv)
+    if known.config:
+        with open(known.config, encoding="utf-8") as f:
+            config = json.load(f)
+        names = {}
+        for action in parser._actions:
+            names[action.dest] = action.dest
+            for opt in action.option_strings:
+                names[opt.lstrip("-").replace("-", "_")] = action.dest
+        unknown = set(config) - set(names)
+        if unknown:
+            parser.error(f"claves desconocidas en {known.config}: {', '.join(sorted(unknown))}")
+        parser.set_defaults(**{names[k]: v for k, v in config.items()})
+    return parser.parse_args(argv)
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Scraper de chats de WhatsApp Web (multi-perfil)")
+    parser.add_argument("--resume", action="store_true",
+                        help="retoma la última corrida: salta chats terminados y solo baja el delta")
+    parser.add_argument("--checkpoint", default=None,
+                        help="archivo SQLite del checkpoint (por defecto checkpoint_<perfil>.sqlite)")
+    parser.add_argument("--format", dest="fmt", choices=sorted(OUTPUT_FORMATS), default="csv",
+                        help="csv (por defecto), parquet o arrow (columnas tipadas, requiere pyarrow)")
+    parser.add_argument("--since", type=parse_cli_date, default=None,
+                        help="solo mensajes desde esta fecha (YYYY-MM-DD, dd/mm/yyyy o 7d); corta el scroll al cruzarla")
+    parser.add_argument("--until", type=parse_cli_date, default=None,
+                        help="solo mensajes hasta esta fecha (incluida)")
+    parser.add_argument("--profiles", default=None,
+                        help="perfiles en paralelo, ej. wpp1,wpp3 o 'all' (headless, sin prompts)")
+    parser.add_argument("--output", default=None,
+                        help="archivo de salida sin extensión, con carpeta si hace falta (ej. /data/exports/diario); "
+                             "si falta se pregunta")
+    parser.add_argument("--profile", default=None,
+                        help="perfil único (wpp1..wpp6); si falta se pregunta")
+    parser.add_argument("--headless", action="store_true",
+                        help="Chrome sin ventana y sin prompts (la sesión ya tiene que estar en el perfil)")
+    parser.add_argument("--login-timeout", type=float, default=120,
+                        help="segundos para que cargue la lista de chats (por defecto 120)")
+    parser.add_argument("--keep-media", action="store_true",
+                        help="no bloquear imágenes/medios en Chrome (implícito con --media / --download-media)")
+    parser.add_argument("--recycle-every", type=int, default=0,
+                        help="reinicia Chrome cada N chats para cortar la hinchazón de memoria (0 = nunca)")
+    parser.add_argument("--trim-dom", action="store_true",
+                        help="deja de renderizar las filas ya cosechadas que quedaron lejos de la vista")
+    parser.add_argument("--heap-limit-mb", type=float, default=0,
+                        help="recarga WhatsApp (o reinicia Chrome) si el heap JS pasa este límite tras un chat")
+    parser.add_argument("--mem-log", default=None,
+                        help="CSV con heap, nodos del DOM y segundos por chat")
+    parser.add_argument("--report", default=None,
+                        help="reporte de la corrida: <ruta>.json + <ruta>.csv (fases, comandos WebDriver, percentiles)")
+    parser.add_argument("--deadline", type=float, default=None,
+                        help="minutos para toda la corrida: reparte el presupuesto por chat y retoma los truncados")
+    parser.add_argument("--order", type=parse_order, default="pane",
+                        help="pane (por defecto) o prioridad: unread,recent,changed (lista el panel antes de abrir chats)")
+    parser.add_argument("--groups", choices=GROUP_POLICIES, default=GROUP_POLICY,
+                        help="grupos detectados en el panel: skip (no se abren, por defecto), last (al final) o keep")
+    parser.add_argument("--exclude-rules", default=None,
+                        help="JSON con reglas de exclusión (exact, normalized, prefix, regex, number)")
+    parser.add_argument("--sync", action="store_true",
+                        help="solo lo nuevo desde la última corrida: no abre chats sin cambios y escribe los mensajes "
+                             "nuevos en un archivo aparte por corrida (salida_AAAAMMDD-HHMMSS)")
+    parser.add_argument("--no-pipeline", action="store_true",
+                        help="escribe checkpoint y salida en el hilo del navegador (sin el hilo escritor)")
+    parser.add_argument("--media", action="store_true",
+                        help="agrega a la salida los metadatos de audios / adjuntos (duración, nombre, tamaño, tipo, "
+                             "dimensiones, pie de foto) sin abrir ni descargar nada")
+    parser.add_argument("--download-media", default=None, metavar="DIR",
+                        help="además baja los adjuntos que el navegador ya tiene a DIR (por contenido, sha256); "
+                             "implica --media. Cuesta una ida y vuelta al navegador por adjunto con el chat abierto "
+                             "(hasta MEDIA_DOWNLOADS_PER_CHAT por chat, sin esperas); el guardado va en el pipeline")
+    parser.add_argument("--media-rate", type=float, default=MEDIA_DOWNLOADS_PER_MINUTE,
+                        help="descargas de adjuntos por minuto con --download-media; lo que no entra se saltea "
+                             "(no se espera) y se reintenta la próxima vez que se abra el chat")
+    parser.add_argument("--config", default=None,
+                        help="JSON con valores por defecto para estos flags")
+    return load_config_defaults(parser)
+
+
+def delta_output_path(path):
+    """--sync: un archivo por corrida (salida_AAAAMMDD-HHMMSS.ext) con solo los mensajes nuevos."""
+    base, ext = os.path.splitext(path)
+    return f"{base}_{datetime.now():%Y%m%d-%H%M%S}{ext}"
+
+
+def safe_csv_name(output_name, ext=".csv"):
+    """
+    --output sin extensión (puede traer carpeta, ej. /data/exports/diario): se limpia solo el nombre
+    del archivo; la carpeta se respeta y se crea si no existe.
+    """
+    folder, name = os.path.split(os.path.expanduser((output_name or "").strip()))
+    if name.lower().endswith(ext):
+        name = name[:-len(ext)]
+    safe_name = "".join(c for c in name if c.isalnum() or c in (" ", "_", "-")).strip().replace(" ", "-")
     if not safe_name:
         safe_name = "todos_los_chats"
-    output_csv = f"{safe_name}.csv"
+    if folder:
+        os.makedirs(folder, exist_ok=True)
+    return os.path.join(folder, f"{safe_name}{ext}")
 
-    all_rows = []
+
+def scrape_all_chats(driver, output_csv, checkpoint_path, resume=False, progress=None, since=None, until=None,
+                     fmt="csv", mem_log=None, report_path=None, deadline_seconds=None, order=(),
+                     groups=GROUP_POLICY, sync=False, pipeline=PIPELINE_BACKGROUND, media=False,
+                     media_dir=None, media_rate=MEDIA_DOWNLOADS_PER_MINUTE):
+    """
+    Recorre el panel izquierdo y scrapea cada chat (lo que antes hacía main()).
+    order: criterios de --order (parse_order); vacío = orden del panel.
+    groups: política de --groups (GROUP_POLICIES); los grupos no cuentan para MAX_NON_GROUP_CHAT.
+    sync: --sync; no abre los chats sin cambios en el panel, en los demás scrollea solo hasta la
+    huella guardada (SYNC_TAIL_KEYS) y escribe solo los mensajes nuevos (output_csv es el delta).
+    pipeline: ChatPipeline en segundo plano; checkpoint y salida se escriben fuera del hilo
+    del navegador (False = en línea, --no-pipeline).
+    media: --media, metadatos de audios / adjuntos en la salida (MEDIA_HEADERS).
+    media_dir: --download-media; baja los adjuntos a ese almacén (MediaDownloader, implica media)
+    a media_rate descargas por minuto.
+    progress: callback opcional que recibe un dict con el avance (lo usa el coordinador multi-perfil).
+    since / until: ventana de fechas (--since / --until).
+    deadline_seconds: tope de la corrida entera (--deadline); reparte el presupuesto por chat
+    (ChatBudget) entre todos los chats del panel (sin --order se lista una vez al arrancar).
+    Los chats que no terminan se guardan truncados y se retoman al final.
+    mem_log: CSV opcional con heap / nodos / segundos por chat (MEM_LOG_HEADERS).
+    report_path: reporte de la corrida (RunReport: fases, comandos WebDriver, percentiles).
+    Devuelve un dict con los totales.
+    """
+    # driver: webdriver suelto o ManagedDriver (este último se reinicia si Chrome se cae)
+    md = driver if isinstance(driver, ManagedDriver) else ManagedDriver(driver=driver)
+    driver = md.driver
+    attempts = {}
+
+    conn = checkpoint_open(checkpoint_path)
+    run_id = checkpoint_start_run(conn, resume=resume)
+    finished = False
+
+    # Con --resume se continúa el mismo CSV; si no existe (o es parquet/arrow), se rellena desde el checkpoint
+    media = media or bool(media_dir)
+    downloader = MediaDownloader(media_dir, per_minute=media_rate) if media_dir else None
+    sink = open_row_sink(output_csv, fmt, append=resume or sync, media=media)
     processed = set()
 
+    if resume:
+        processed |= checkpoint_completed_titles(conn, run_id)
+        if not sink.append:
+            sink.write_rows(checkpoint_run_rows(conn, run_id))
+            sink.flush()
+        print(f"🔁 Reanudando corrida #{run_id}: {len(processed)} chats ya terminados.")
+
+    pipeline = ChatPipeline(checkpoint_path, run_id, sink, background=pipeline, media=downloader)
+
+    # chats que quedaron a medias en una corrida anterior: se sigue desde donde llegaron
+    prev_truncated = checkpoint_truncated_chats(conn) if resume or sync else {}
+    budget = ChatBudget(deadline_seconds=deadline_seconds)
+    truncated = {}  # título -> {"budget", "rows", "done"}
+    deadline_hit = False
+
     max_rounds = 80
     pane_step = 1200
+    pane_offset = 0  # cuánto se bajó el panel (para volver ahí tras reiniciar Chrome)
 
-    skipped_timeouts = 0
-    skipped_errors = 0
-    non_group_count = 0
+    run_report = RunReport(report_path)
+    cmd_counts = count_webdriver_commands(driver)
 
-    timed_out_chats = []  # ✅ NUEVO: lista de chats que exceden tiempo
+    mem_file = open(mem_log, "w", newline="", encoding="utf-8") if mem_log else None
+    mem_writer = csv.writer(mem_file) if mem_file else None
+    if mem_writer:
+        mem_writer.writerow(MEM_LOG_HEADERS)
 
-    print("\n🚀 Recorriendo chats: del más reciente al más antiguo...")
+    skipped_timeouts = 0
+    skipped_errors = 0
+    non_group_count = len(processed)
+
+    def report(status, current=""):
+        if progress:
+            progress({
+                "status": status,
+                "current": current,
+                "chats": non_group_count,
+                "messages": sink.rows_written,
+                "timeouts": skipped_timeouts,
+                "errors": skipped_errors,
+                "restarts": sum(md.restarts.values()),
+            })
+
+    work_queue = None
+    group_cache = {}  # título -> señal de grupo, por corrida (classify_groups)
+    skipped_groups = 0
+    listed = {}  # título -> última fila del panel vista (se guarda con el chat para --sync)
+    sync_state = checkpoint_chat_states(conn) if sync else {}
+    unchanged = 0
 
     try:
+        # --order / --groups last: primero se lista el panel entero (sin abrir chats) y se arma
+        # la cola por prioridad
+        listing = None
+        if order or groups == "last":
+            print(f"\n🗂️ Listando el panel completo (orden: {', '.join(order) or 'panel'}, grupos: {groups})...")
+            t0 = time.time()
+            listing = classify_groups(enumerate_chat_list(driver, pane_step, since=since), group_cache)
+            work_queue = prioritize_chats(listing, order, checkpoint_newest_metas(conn), groups_last=groups != "keep")
+            print(f"🗂️ {len(work_queue)} chats listados en {time.time() - t0:.1f}s. Primeros de la cola:")
+            for c in work_queue[:10]:
+                print(f"   {c['title']} | no leídos: {c['unread']} | última actividad: {c['activity'] or '?'}")
+            print("\n🚀 Recorriendo chats por prioridad...")
+        else:
+            if budget.deadline:
+                # el tiempo se reparte entre todos los chats del panel, no solo los que se ven ahora
+                print("\n🗂️ Contando los chats del panel para repartir el --deadline...")
+                listing = classify_groups(enumerate_chat_list(driver, pane_step, since=since), group_cache)
+                print(f"🗂️ {len(listing)} chats en el panel.")
+            print("\n🚀 Recorriendo chats: del más reciente al más antiguo...")
+        # títulos que la corrida todavía tiene que abrir (presupuesto de la primera pasada)
+        to_visit = {c["title"] for c in listing or ()
+                    if not (groups == "skip" and c["group"] in STRONG_GROUP_SIGNALS)}
+
         for r in range(max_rounds):
-            titles = get_visible_chat_titles(driver)
-            print("DEBUG: titles visibles =", titles[:8], " total =", len(titles))
+            restarted = False
+            # títulos + no leídos + última actividad en una sola llamada (o la cola de --order)
+            chats = work_queue if work_queue is not None else classify_groups(get_visible_chats(driver), group_cache)
+            titles = [c["title"] for c in chats]
+            if work_queue is None:
+                print("DEBUG: titles visibles =", titles[:8], " total =", len(titles))
+
+            # grupos: se saltan sin abrirlos
+            if groups == "skip":
+                for c in chats:
+                    if c["group"] in STRONG_GROUP_SIGNALS and c["title"] not in processed:
+                        print(f"👥 '{c['title']}' es un grupo ({c['group']}). Saltando sin abrir.")
+                        processed.add(c["title"])
+                        skipped_groups += 1
+
+            # --sync: misma fila del panel que la última vez -> no hay nada nuevo, no se abre
+            if sync:
+                for c in chats:
+                    if c["title"] not in processed and chat_unchanged(c, sync_state.get(c["title"])):
+                        print(f"💤 '{c['title']}' sin cambios desde la última sincronización. Saltando.")
+                        processed.add(c["title"])
+                        unchanged += 1
+            listed.update((c["title"], c) for c in chats)
+
+            # --since: chats sin actividad desde el corte no se abren
+            if since:
+                for c in chats:
+                    if c["date"] is not None and c["date"] < since and c["title"] not in processed:
+                        print(f"📅 '{c['title']}' sin actividad desde {since}. Saltando.")
+                        processed.add(c["title"])
 
             new_titles = [t for t in titles if t not in processed]
 
             if not new_titles:
-                scroll_left_pane(driver, pane_step)
+                if work_queue is not None:
+                    print("✅ Cola de chats terminada.")
+                    break
+                if not scroll_left_pane(driver, pane_step, since=since):
+                    print("✅ No hay más chats dentro de la ventana de fechas. Terminando.")
+                    break
+                pane_offset += pane_step
                 titles2 = get_visible_chat_titles(driver)
                 new_titles = [t for t in titles2 if t not in processed]
 
@@ -478,78 +3027,456 @@ def main():
                     print("✅ No hay más chats nuevos en el panel. Terminando.")
                     break
 
-            for title in new_titles:
+            for i, title in enumerate(new_titles):
                 if non_group_count >= MAX_NON_GROUP_CHAT:
                     print(f"🛑 Límite alcanzado: {MAX_NON_GROUP_CHAT} chats (sin contar grupos).")
                     break
 
+                if budget.expired():
+                    print("⏰ Se acaba el tiempo de la corrida (--deadline): no se abren más chats.")
+                    deadline_hit = True
+                    break
+
                 print(f"📌 Abriendo chat: {title}")
 
                 # excluidos
-                if norm_title(title) in EXCLUDE_TITLES_NORM:
-                    print("⛔ En lista de excluidos. Saltando (no se scrapea).")
+                rule = EXCLUSIONS.match(title)
+                if rule:
+                    print(f"⛔ Excluido ({rule}). Saltando (no se scrapea).")
                     processed.add(title)
                     continue
 
+                report("scrapeando", title)
                 try:
+                    run_report.start_chat(cmd_counts)
+                    waits0 = dict(WAIT_STATS)
                     open_chat_by_title(driver, title)
                     print("📩 Extrayendo mensajes...")
 
-                    rows, timed_out = scrape_messages_from_current_chat(driver, title)
+                    # lo que de verdad falta: lo listado (cola o panel entero) que todavía no se
+                    # procesó, sin pasarse del tope
+                    chats_left = min(max(len(to_visit - processed), len(new_titles) - i),
+                                     MAX_NON_GROUP_CHAT - non_group_count)
+                    chat_budget = budget.first_pass(chats_left)
+                    known = checkpoint_known_keys(conn, title) if resume else None
+                    if sync and not resume and title in sync_state:
+                        # basta con la huella: se corta apenas aparece uno de los últimos guardados
+                        known = sync_state[title]["tail_keys"] or None
+                    skip = None
+                    if title in prev_truncated:
+                        # quedó truncado antes: lo guardado se salta sin cortar y se sigue más arriba
+                        skip, known = (known if resume else checkpoint_known_keys(conn, title)), None
+                    t_scrape = time.time()
+                    rows, timed_out = scrape_messages_from_current_chat(
+                        driver, title, time_limit_seconds=chat_budget, known_keys=known,
+                        since=since, until=until, skip_keys=skip, media=media,
+                    )
+                    budget.observe(len(rows), time.time() - t_scrape)
+                    fixed, waited = wait_stats_since(waits0)
+                    print(f"⏱️ Esperas: {waited:.1f}s (con sleeps fijos: {fixed:.1f}s → ahorro {fixed - waited:.1f}s)")
+
+                    print(f"✅ Mensajes: {len(rows)}" + (" (truncado)" if timed_out else ""))
+                    if downloader:
+                        # el chat sigue abierto: sus blobs todavía son accesibles (se guardan en el pipeline)
+                        with phase("media"):
+                            downloader.fetch_chat(driver, title, rows)
+                    with phase("enqueue"):
+                        pipeline.submit(title, rows, truncated=timed_out, listing=listed.get(title))
+                    processed.add(title)
 
                     if timed_out:
                         skipped_timeouts += 1
-                        timed_out_chats.append(title)  # ✅ NUEVO
-                        print(f"⏭️ Chat omitido por timeout. Total timeouts: {skipped_timeouts}")
-                        processed.add(title)
-                        continue  # ✅ NO se guarda nada
-
-                    print(f"✅ Mensajes: {len(rows)}")
-                    all_rows.extend(rows)
-                    processed.add(title)
-
-                    non_group_count += 1
-                    print(f"✅ Chats no-grupo procesados: {non_group_count}/{MAX_NON_GROUP_CHAT}")
-
+                        truncated[title] = {"budget": chat_budget, "rows": len(rows) + len(skip or ()), "done": False}
+
+                    if group_cache.get(title):
+                        print("👥 Grupo: no cuenta para el límite de chats.")
+                    else:
+                        non_group_count += 1
+                        print(f"✅ Chats no-grupo procesados: {non_group_count}/{MAX_NON_GROUP_CHAT}")
+
+                    mem = browser_metrics(driver)
+                    stat = run_report.end_chat(title, "truncated" if timed_out else "ok", messages=len(rows), mem=mem)
+                    recycled = md.chat_done(mem.get("heap_mb"))
+                    log_chat_memory(mem_writer, non_group_count, title, stat["seconds"], mem,
+                                    "recarga" if recycled else "")
+                    if recycled:
+                        driver = md.driver
+                        cmd_counts = count_webdriver_commands(driver)
+                        restarted = True
+                        break
+
+                except PipelineError:
+                    raise  # no es culpa del chat: sin escritor no tiene sentido abrir los demás
                 except Exception as e:
+                    if md.factory and not md.healthy():
+                        # Chrome muerto: reiniciar y devolver el chat a la cola (no se marca procesado)
+                        attempts[title] = attempts.get(title, 0) + 1
+                        print(f"💥 Chrome no responde en '{title}' ({e.__class__.__name__}).")
+                        run_report.end_chat(title, "crash")
+                        report("reiniciando", title)
+                        driver = md.restart("crash")
+                        cmd_counts = count_webdriver_commands(driver)
+                        restarted = True
+                        if attempts[title] >= MAX_CHAT_ATTEMPTS:
+                            skipped_errors += 1
+                            print(f"⚠️ '{title}' falló {attempts[title]} veces. Se abandona.")
+                            processed.add(title)
+                        break
                     skipped_errors += 1
+                    run_report.end_chat(title, "error")
                     print(f"⚠️ Error en chat '{title}': {e} | errors={skipped_errors}")
                     processed.add(title)
                     continue
 
-            if non_group_count >= MAX_NON_GROUP_CHAT:
+            if restarted:
+                # Chrome nuevo arranca con el panel arriba: volver a donde íbamos; el chat
+                # re-encolado (no marcado como procesado) vuelve a estar a la vista
+                if pane_offset:
+                    scroll_left_pane(driver, pane_offset)
+                continue
+            if non_group_count >= MAX_NON_GROUP_CHAT or deadline_hit:
+                break
+            if work_queue is not None:
+                continue  # la cola no depende del scroll: otra vuelta por lo que quedó
+
+            if not scroll_left_pane(driver, pane_step, since=since):
+                break
+            pane_offset += pane_step
+
+        # Reintentos: los chats truncados siguen desde donde quedaron, con más presupuesto
+        for attempt in range(1, MAX_BUDGET_RETRIES + 1):
+            pending = [t for t, info in truncated.items() if not info["done"]]
+            if not pending or budget.expired():
                 break
+            print(f"\n🔁 Reintento {attempt}/{MAX_BUDGET_RETRIES}: {len(pending)} chats truncados")
+            pipeline.drain()  # skip_keys sale del checkpoint: tiene que estar todo escrito
 
-            scroll_left_pane(driver, pane_step)
+            for k, title in enumerate(pending):
+                if budget.expired():
+                    print("⏰ Sin tiempo para más reintentos (--deadline).")
+                    break
+                info = truncated[title]
+                chat_budget = budget.retry(info["budget"], info["rows"], len(pending) - k)
+                report("reintentando", title)
+                run_report.start_chat(cmd_counts)
+                try:
+                    open_chat_by_title(driver, title)
+                    print(f"📩 Retomando '{title}' con {chat_budget:.0f}s (ya guardados: {info['rows']})")
+
+                    t_scrape = time.time()
+                    rows, timed_out = scrape_messages_from_current_chat(
+                        driver, title, time_limit_seconds=chat_budget, since=since, until=until,
+                        skip_keys=checkpoint_known_keys(conn, title), media=media,
+                    )
+                    budget.observe(len(rows), time.time() - t_scrape)
+
+                    if downloader:
+                        # el chat sigue abierto: sus blobs todavía son accesibles (se guardan en el pipeline)
+                        with phase("media"):
+                            downloader.fetch_chat(driver, title, rows)
+                    with phase("enqueue"):
+                        pipeline.submit(title, rows, truncated=timed_out, listing=listed.get(title))
+                    info.update(budget=chat_budget, rows=info["rows"] + len(rows), done=not timed_out)
+                    run_report.end_chat(title, "truncated" if timed_out else "ok", messages=len(rows))
+                    print(f"✅ +{len(rows)} mensajes" + (" (sigue truncado)" if timed_out else " (completo)"))
+                except PipelineError:
+                    raise
+                except Exception as e:
+                    run_report.end_chat(title, "error")
+                    print(f"⚠️ Error retomando '{title}': {e}")
+                    if md.factory and not md.healthy():
+                        driver = md.restart("crash")
+                        cmd_counts = count_webdriver_commands(driver)
+
+        finished = True
 
     finally:
+        try:
+            pipeline.close()
+        except Exception as e:
+            finished = False
+            print(f"⚠️ Error en el pipeline de escritura: {e}")
+        if finished:
+            checkpoint_finish_run(conn, run_id)
+        reached = checkpoint_truncated_chats(conn)
+        conn.close()
+
+        try:
+            sink.close()
+        except Exception as e:
+            print(f"⚠️ Error guardando {fmt.upper()}:", e)
+
+        report("listo" if finished else "interrumpido")
+
         print(f"\n📊 Chats procesados (incluye skips): {len(processed)}")
-        print(f"📊 Mensajes totales recolectados: {len(all_rows)}")
-        print(f"⏭️ Chats omitidos por timeout: {skipped_timeouts}")
+        print(f"👥 Grupos salteados sin abrir: {skipped_groups}")
+        if sync:
+            print(f"💤 Chats sin cambios (no se abrieron): {unchanged}")
+        print(f"📊 Mensajes escritos en esta ejecución: {sink.rows_written}")
+        print(f"✂️ Chats truncados por presupuesto: {skipped_timeouts}")
         print(f"⚠️ Chats omitidos por error: {skipped_errors}")
-
-        # ✅ NUEVO: imprimir lista de chats con timeout
-        if timed_out_chats:
-            print("\n⏱️ Chats que superaron el tiempo límite (NO guardados):")
-            for i, t in enumerate(timed_out_chats, 1):
-                print(f"  {i:02d}. {t}")
+        print(f"⏱️ Esperas totales: {WAIT_STATS['waited']:.0f}s (con sleeps fijos: {WAIT_STATS['fixed']:.0f}s)")
+        print(f"🧭 Chats abiertos: panel={NAV_STATS['panel']} | buscador={NAV_STATS['search']} | enlace={NAV_STATS['link']}")
+        pm = pipeline.metrics()
+        print(f"🧵 Pipeline ({'en segundo plano' if pipeline.background else 'en línea'}): cola máx {pm['max_depth']} "
+              f"| navegador esperando {pm['producer_wait_s']:.1f}s | escribiendo {pm['write_s']:.1f}s "
+              f"| latencia media {pm['latency_s']:.2f}s")
+        if downloader:
+            print(f"📎 Adjuntos: {MEDIA_STATS['fetched']} descargados ({MEDIA_STATS['bytes'] / 1e6:.1f} MB) | "
+                  f"repetidos {MEDIA_STATS['deduped']} | fuera de cupo {MEDIA_STATS['skipped']} | "
+                  f"fallidos {MEDIA_STATS['failed']} → {media_dir}")
+        print(f"🔄 Reinicios de Chrome: {sum(md.restarts.values())} "
+              f"(caídas: {md.restarts['crash']}, reciclados: {md.restarts['recycle']}, "
+              f"por memoria: {md.restarts['memory']}) | recargas de página: {md.reloads}")
+        if mem_file:
+            mem_file.close()
+        run_report.save({"output": output_csv, "completed": finished, "restarts": dict(md.restarts),
+                         "groups_skipped": skipped_groups, "navigation": dict(NAV_STATS),
+                         "unchanged": unchanged, "pipeline": pm, "media": dict(MEDIA_STATS) if downloader else None})
+
+        # chats que siguen a medias: se guardó lo leído y hasta dónde se llegó
+        still = [t for t, info in truncated.items() if not info["done"]]
+        if truncated:
+            print(f"\n✂️ Truncados: {len(truncated)} | completados en reintentos: {len(truncated) - len(still)}")
+            for i, t in enumerate(still, 1):
+                print(f"  {i:02d}. {t} | guardados: {truncated[t]['rows']} | hasta: {reached.get(t) or '?'}")
         else:
-            print("\n⏱️ No hubo chats que superaran el tiempo límite.")
+            print("\n⏱️ Ningún chat agotó su presupuesto.")
 
-        # Guardar CSV
-        if all_rows:
-            try:
-                save_to_csv(output_csv, all_rows)
-                print(f"\n✅ CSV generado correctamente: {output_csv}")
-            except Exception as e:
-                print("⚠️ Error guardando CSV:", e)
+        # Cerrar CSV (ya se fue escribiendo chat por chat)
+        if sink.rows_written or sink.append:
+            print(f"\n✅ {fmt.upper()} generado correctamente: {output_csv}")
         else:
-            print("⚠️ No se recolectaron mensajes. No se generará CSV.")
+            print("⚠️ No se recolectaron mensajes. No se generó archivo.")
+
+    return {
+        "chats": non_group_count,
+        "messages": sink.rows_written,
+        "timeouts": skipped_timeouts,
+        "truncated": len([t for t, info in truncated.items() if not info["done"]]),
+        "groups_skipped": skipped_groups,
+        "errors": skipped_errors,
+        "restarts": dict(md.restarts),
+    }
 
+
+# ======================================================
+# 8) MULTI-PERFIL EN PARALELO
+# ======================================================
+
+def profile_worker(profile, output_csv, opts, progress_queue, driver_opts=None):
+    """
+    Un proceso por perfil: su propio Chrome headless, su propio CSV (shard) y su checkpoint.
+    Los prints van a scrape_<perfil>.log para no ensuciar la vista del coordinador.
+    opts: kwargs para scrape_all_chats (resume, since, until, fmt, mem_log, report_path, deadline_seconds).
+    driver_opts: login_timeout, block_media, recycle_every, heap_limit_mb y trim_dom.
+    """
+    log = open(f"scrape_{profile}.log", "w", encoding="utf-8", buffering=1)
+    sys.stdout = sys.stderr = log
+
+    def progress(ev):
+        progress_queue.put({"profile": profile, **ev})
+
+    global TRIM_DOM, EXCLUSIONS
+    driver_opts = driver_opts or {}
+    # proceso nuevo: los globals no se heredan en Windows
+    TRIM_DOM = driver_opts.get("trim_dom", False)
+    EXCLUSIONS = load_exclusion_rules(driver_opts.get("exclude_rules"))
+    # un log / reporte por perfil
+    for key in ("mem_log", "report_path"):
+        if opts.get(key):
+            root, ext = os.path.splitext(opts[key])
+            opts = {**opts, key: f"{root}_{profile}{ext or '.csv'}"}
+
+    md = ManagedDriver(
+        lambda: setup_driver(profile, headless=True, block_media=driver_opts.get("block_media", True)),
+        recycle_every=driver_opts.get("recycle_every", 0),
+        login_timeout=driver_opts.get("login_timeout", 120),
+        heap_limit_mb=driver_opts.get("heap_limit_mb", 0),
+    )
+    try:
+        progress({"status": "iniciando"})
+        md.start()
+        scrape_all_chats(md, output_csv, f"checkpoint_{profile}.sqlite", progress=progress, **opts)
+    except Exception as e:
+        print(f"⚠️ Worker {profile} falló: {e}")
+        progress({"status": f"error: {e}"[:60]})
+    finally:
+        md.quit()
+        log.close()
+
+
+def merge_csv_shards(shards, output_csv, media=False):
+    """
+    Une los CSV de cada perfil en uno solo (una sola cabecera, + MEDIA_HEADERS con --media).
+    Cada shard se lee con su propia cabecera: uno continuado sin columnas media_* queda en blanco ahí.
+    Devuelve filas escritas.
+    """
+    total = 0
+    with open(output_csv, "w", newline="", encoding="utf-8-sig") as out:
+        writer = csv.DictWriter(out, fieldnames=CSV_HEADERS + MEDIA_HEADERS if media else CSV_HEADERS,
+                                extrasaction="ignore")
+        writer.writeheader()
+        for shard in shards:
+            if not os.path.exists(shard):
+                continue
+            with open(shard, newline="", encoding="utf-8-sig") as f:
+                for row in csv.DictReader(f):
+                    writer.writerow(row)
+                    total += 1
+    return total
+
+
+def merge_arrow_shards(shards, output_path, media=False):
+    """
+    Igual que merge_csv_shards para parquet/arrow: copia los shards lote a lote, sin cargarlos enteros.
+    Las columnas del esquema que falten en un shard se completan con nulos.
+    """
+    if pa is None:
+        raise RuntimeError("--format parquet/arrow necesita pyarrow (pip install pyarrow)")
+    is_parquet = output_path.endswith(".parquet")
+    schema = arrow_schema(media)
+    total = 0
+    writer = pq.ParquetWriter(output_path, schema, compression="zstd") if is_parquet else pa_ipc.new_file(output_path, schema)
+    try:
+        for shard in shards:
+            if not os.path.exists(shard):
+                continue
+            if is_parquet:
+                batches = pq.ParquetFile(shard).iter_batches()
+            else:
+                reader = pa_ipc.open_file(shard)
+                batches = (reader.get_batch(i) for i in range(reader.num_record_batches))
+            for batch in batches:
+                table = pa.Table.from_batches([batch])
+                table = pa.table({
+                    f.name: table.column(f.name) if f.name in table.column_names else pa.nulls(batch.num_rows, f.type)
+                    for f in schema
+                }).cast(schema)
+                writer.write_table(table)
+                total += batch.num_rows
+    finally:
+        writer.close()
+    return total
+
+
+def render_progress(state, t0):
+    parts = []
+    for p, st in state.items():
+        parts.append(f"{p}: {st['status'][:12]} {st.get('chats', 0)}ch/{st.get('messages', 0)}m")
+    chats = sum(st.get("chats", 0) for st in state.values())
+    msgs = sum(st.get("messages", 0) for st in state.values())
+    line = " | ".join(parts) + f" || TOTAL {chats} chats, {msgs} msgs, {time.time() - t0:.0f}s"
+    print("\r" + line, end="", flush=True)
+
+
+def run_profiles_parallel(profiles, output_csv, driver_opts=None, **opts):
+    base, ext = os.path.splitext(output_csv)
+    shards = {p: f"{base}_{p}{ext}" for p in profiles}
+
+    progress_queue = multiprocessing.Queue()
+    procs = [
+        multiprocessing.Process(target=profile_worker, args=(p, shards[p], opts, progress_queue, driver_opts), name=p)
+        for p in profiles
+    ]
+
+    state = {p: {"status": "pendiente"} for p in profiles}
+    t0 = time.time()
+
+    print(f"🚀 Lanzando {len(procs)} perfiles en paralelo: {', '.join(profiles)}")
+    for proc in procs:
+        proc.start()
+
+    while any(proc.is_alive() for proc in procs) or not progress_queue.empty():
         try:
-            driver.quit()
-        except Exception:
+            ev = progress_queue.get(timeout=1)
+            state[ev["profile"]].update(ev)
+        except queue.Empty:
             pass
+        render_progress(state, t0)
+
+    for proc in procs:
+        proc.join()
+        if proc.exitcode not in (0, None) and not state[proc.name]["status"].startswith("error"):
+            state[proc.name]["status"] = f"salió con código {proc.exitcode}"
+
+    print()
+    fmt = opts.get("fmt", "csv")
+    merge = merge_csv_shards if fmt == "csv" else merge_arrow_shards
+    total = merge([shards[p] for p in profiles], output_csv, media=opts.get("media") or bool(opts.get("media_dir")))
+
+    print(f"\n📊 Tiempo total: {time.time() - t0:.0f}s")
+    for p in profiles:
+        st = state[p]
+        print(f"  {p}: {st['status']} | chats={st.get('chats', 0)} | mensajes={st.get('messages', 0)}"
+              f" | reinicios={st.get('restarts', 0)} | log=scrape_{p}.log")
+    print(f"\n✅ {fmt.upper()} combinado: {output_csv} ({total} filas)")
+
+
+def main():
+    global TRIM_DOM, EXCLUSIONS
+    args = parse_args()
+    ext = OUTPUT_FORMATS[args.fmt]
+    driver_opts = {
+        "login_timeout": args.login_timeout,
+        # --media / --download-media leen dimensiones y blobs de las imágenes: no se pueden bloquear
+        "block_media": not (args.keep_media or args.media or args.download_media),
+        "recycle_every": args.recycle_every,
+        "heap_limit_mb": args.heap_limit_mb,
+        "trim_dom": args.trim_dom,
+        "exclude_rules": args.exclude_rules,
+    }
+    # se carga acá también para que un JSON roto falle antes de abrir Chrome
+    EXCLUSIONS = load_exclusion_rules(args.exclude_rules)
+    print(f"⛔ Reglas de exclusión: {EXCLUSIONS.size}")
+
+    if args.profiles:
+        profiles = PROFILES if args.profiles == "all" else [
+            p.strip().lower() for p in args.profiles.split(",") if p.strip().lower() in PROFILES
+        ]
+        run_profiles_parallel(
+            profiles, delta_output_path(safe_csv_name(args.output, ext)) if args.sync
+            else safe_csv_name(args.output, ext), driver_opts=driver_opts,
+            resume=args.resume, since=args.since, until=args.until, fmt=args.fmt,
+            mem_log=args.mem_log, report_path=args.report,
+            order=args.order, groups=args.groups, sync=args.sync, pipeline=not args.no_pipeline,
+            media=args.media, media_dir=args.download_media, media_rate=args.media_rate,
+            deadline_seconds=args.deadline * 60 if args.deadline else None,
+        )
+        return
+
+    # con --headless no hay nadie para contestar prompts
+    profile = args.profile
+    if profile is None and not args.headless:
+        profile = input("Perfil (wpp1..wpp6): ").strip().lower()
+    if profile not in set(PROFILES):
+        profile = "wpp1"
+    print("✅ Usando perfil:", profile)
+
+    TRIM_DOM = args.trim_dom
+
+    if args.output is None and not args.headless:
+        args.output = input("Nombre del archivo de salida (sin extensión): ").strip()
+    output_csv = safe_csv_name(args.output, ext)
+    if args.sync:
+        output_csv = delta_output_path(output_csv)
+
+    md = ManagedDriver(
+        lambda: setup_driver(profile, headless=args.headless, block_media=driver_opts["block_media"]),
+        recycle_every=args.recycle_every, login_timeout=args.login_timeout, heap_limit_mb=args.heap_limit_mb,
+    )
+    try:
+        md.start(interactive=not args.headless)
+        scrape_all_chats(
+            md, output_csv, args.checkpoint or f"checkpoint_{profile}.sqlite",
+            resume=args.resume, since=args.since, until=args.until, fmt=args.fmt,
+            mem_log=args.mem_log, report_path=args.report,
+            order=args.order, groups=args.groups, sync=args.sync, pipeline=not args.no_pipeline,
+            media=args.media, media_dir=args.download_media, media_rate=args.media_rate,
+            deadline_seconds=args.deadline * 60 if args.deadline else None,
+        )
+    finally:
+        md.quit()
 
 
 if __name__ == "__main__":